@@ -0,0 +1,120 @@
+import argparse
+import tempfile
+from JWST_MG.constants import *
+
+# Prepared GSMF data vectors read by the SMF likelihoods; bump the version
+# whenever the selection, the error model or the layout of the files changes
+GSMF_data_version = 1
+GSMF_data_path = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'observational_data')
+GSMF_redshifts = [0, 1, 1.75, 4, 5, 6, 7, 8]
+
+
+"""
+Collect the GSMF data points at one redshift.
+
+All 'data' entries of astrodatapy are used except at z = 8, and the Navarro
+et al. points are added at z = 4-8. The error is the full width of the
+astrodatapy error bar, and twice the quoted Navarro error.
+
+Parameters:
+    z (float): The redshift.
+    path (str, optional): Directory holding the GSMF/Navarro_z*.dat files.
+
+Returns:
+    tuple: Arrays of the stellar masses, GSMF values and errors.
+"""
+
+
+def GSMF_points(z, path=GSMF_data_path):
+    x = []
+    y = []
+    yerr = []
+    if z != 8:
+        obs = number_density(feature='GSMF', z_target=z, h=h)
+        for ii in range(obs.n_target_observation):
+            data = obs.target_observation['Data'][ii]
+            datatype = obs.target_observation['DataType'][ii]
+            if datatype == 'data':
+                x = np.concatenate((x, 10**data[:, 0]), axis=None)
+                y = np.concatenate((y, data[:, 1]), axis=None)
+                yerr = np.concatenate((yerr, data[:, 2]-data[:, 3]), axis=None)
+
+    if z in [4, 5, 6, 7, 8]:
+        Navarro = np.loadtxt(os.path.join(path, 'GSMF', 'Navarro_z%g.dat' % z))
+        x = np.concatenate((x, 10**Navarro[:, 0]), axis=None)
+        y = np.concatenate((y, 1e-4*Navarro[:, 1]), axis=None)
+        yerr = np.concatenate((yerr, 2*1e-4*Navarro[:, 2]), axis=None)
+    return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.asarray(yerr, dtype=np.float64)
+
+
+"""
+Build the GSMF data vectors and write them in the format read by load_GSMF_data.
+
+The points of all redshifts are concatenated into one (3, N) float64 array of
+x, y and yerr (GSMF_table.npy); GSMF_axes.npz holds the version, the redshifts
+and the offsets of every redshift in the concatenated vectors.
+
+Parameters:
+    zs (array, optional): The redshifts.
+    path (str, optional): Directory of the observational data and the output.
+"""
+
+
+def build_GSMF_data(zs=GSMF_redshifts, path=GSMF_data_path):
+    points = [GSMF_points(z, path) for z in zs]
+    offsets = np.cumsum([0] + [len(x) for x, y, yerr in points])
+    table = np.concatenate([np.stack(point) for point in points], axis=1)
+
+    with tempfile.NamedTemporaryFile(dir=path, suffix='.tmp', delete=False) as f:
+        np.save(f, table)
+        tmpname = f.name
+    os.replace(tmpname, os.path.join(path, 'GSMF_table.npy'))
+    # The axes go last so that they only describe a complete table
+    with tempfile.NamedTemporaryFile(dir=path, suffix='.tmp', delete=False) as f:
+        np.savez(f, version=GSMF_data_version, zs=np.asarray(zs, dtype=np.float64), offsets=offsets)
+        tmpname = f.name
+    os.replace(tmpname, os.path.join(path, 'GSMF_axes.npz'))
+
+
+"""
+Load the GSMF data vectors, building them first if they are missing or stale.
+
+The table is memory-mapped, so pool workers neither query astrodatapy nor
+copy the data.
+
+Parameters:
+    zs (array, optional): The redshifts.
+    path (str, optional): Directory holding the prepared data.
+
+Returns:
+    tuple: Lists x, y and yerr with one array per redshift.
+"""
+
+
+def load_GSMF_data(zs=GSMF_redshifts, path=GSMF_data_path):
+    for attempt in range(2):
+        try:
+            with np.load(os.path.join(path, 'GSMF_axes.npz')) as axes:
+                if int(axes['version']) == GSMF_data_version and np.array_equal(axes['zs'], zs):
+                    offsets = axes['offsets']
+                    table = np.load(os.path.join(path, 'GSMF_table.npy'), mmap_mode='r')
+                    x, y, yerr = ([column[offsets[i]:offsets[i+1]] for i in range(len(zs))]
+                                  for column in table)
+                    return x, y, yerr
+        except (OSError, KeyError, ValueError):
+            pass
+        if attempt == 0:
+            build_GSMF_data(zs, path)
+    raise Exception("Could not load the GSMF data from " + path + ".")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Prepare the GSMF data vectors read by JWST_MG.GSMF_data.')
+    parser.add_argument('--z', nargs='+', type=float, default=GSMF_redshifts,
+                        help='redshifts of the data vectors')
+    parser.add_argument('--output', default=GSMF_data_path,
+                        help='directory of the observational data and the prepared vectors')
+    args = parser.parse_args()
+    build_GSMF_data(args.z, args.output)
@@ -1,6 +1,143 @@
 from JWST_MG.constants import *
 from JWST_MG.cosmological_functions import cosmological_functions
 from JWST_MG.delta_c import delta_c
+from JWST_MG.cache import Pk_disk_cache, LRU_cache, array_fingerprint
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Halo mass functions shared by SMF, SMD and UVLF, keyed by cosmology, a, masses and P(k)
+HMF_cache = LRU_cache(maxsize=256)
+
+
+"""
+Quadrature weights for variance integrals over a log-spaced k grid.
+
+Parameters:
+    k (array): Wavenumbers in units of 1/Mpc.
+    Pk (array): Linear matter power spectrum at k.
+
+Returns:
+    numpy.ndarray: Weights w such that sigma^2(R) = sum(W(kR)^2 * w), i.e. the
+    trapezoidal rule in ln(k) applied to P(k) k^3/(2 pi^2).
+"""
+
+
+def variance_weights(k, Pk):
+    k = np.asarray(k, dtype=np.float64)
+    dlnk = np.diff(np.log(k))
+    weights = np.zeros_like(k)
+    weights[:-1] += 0.5*dlnk
+    weights[1:] += 0.5*dlnk
+    return weights*np.asarray(Pk, dtype=np.float64)*k**3/(2.0*np.pi**2)
+
+
+"""
+Compute sigma(R) for many radii with one weighted matrix-vector product per chunk.
+
+Parameters:
+    k (array): Wavenumbers in units of 1/Mpc (log-spaced).
+    Pk (array): Linear matter power spectrum at k.
+    R (array): Filter radii, any shape.
+    derivative (bool, optional): Also return dsigma/dR from the analytic
+        window derivative R dW/dR = -beta_ST (kR)^beta_ST W^2.
+    chunk_size (int, optional): Number of radii per (chunk_size x n_k) window
+        matrix; by default chosen so that a chunk holds about 2**21 elements.
+    weights (array, optional): Precomputed quadrature weights at k (for
+        instance from variance_k_grid); Pk is ignored when they are given.
+
+Returns:
+    numpy.ndarray or tuple: sigma(R) with the shape of R, and dsigma/dR if requested.
+"""
+
+
+def sigma_many(k, Pk, R, derivative=False, chunk_size=None, weights=None):
+    beta_ST = 4.8
+    k = np.asarray(k, dtype=np.float64)
+    R = np.asarray(R, dtype=np.float64)
+    if weights is None:
+        weights = variance_weights(k, Pk)
+    if chunk_size is None:
+        chunk_size = max(1, 2**21//len(k))
+
+    R_flat = R.ravel()
+    sigma2 = np.empty(R_flat.shape, dtype=np.float64)
+    dsigma2dR = np.empty(R_flat.shape, dtype=np.float64)
+    for start in range(0, len(R_flat), chunk_size):
+        R_chunk = R_flat[start:start+chunk_size]
+        x = (np.outer(R_chunk, k))**beta_ST
+        W = (1+x)**(-1)
+        sigma2[start:start+chunk_size] = (W**2) @ weights
+        if derivative:
+            dsigma2dR[start:start+chunk_size] = -2*beta_ST / \
+                R_chunk*((x*W**3) @ weights)
+
+    sigma = np.sqrt(sigma2).reshape(R.shape)
+    if derivative:
+        return sigma, (dsigma2dR/(2*np.sqrt(sigma2))).reshape(R.shape)
+    return sigma
+
+
+"""
+Resample the k grid for variance integrals to a compact composite Gauss-Legendre rule in ln(k).
+
+The ln(k) range is first trimmed to where the sigma integrand of the smallest
+and largest radius is non-negligible, then the number of Gauss-Legendre panels
+is doubled until sigma and dsigma/dR on test radii agree with the full-grid
+result to the requested relative accuracy.
+
+Parameters:
+    k (array): Wavenumbers in units of 1/Mpc (log-spaced).
+    Pk (array): Linear matter power spectrum at k.
+    R_min, R_max (float): Range of filter radii the grid has to serve.
+    rtol (float, optional): Target relative error in sigma and dsigma/dR.
+    order (int, optional): Number of Gauss-Legendre nodes per panel.
+    n_test (int, optional): Number of log-spaced test radii.
+
+Returns:
+    tuple: Nodes k, quadrature weights for sigma_many, and the achieved
+    maximum relative error with respect to the full grid.
+"""
+
+
+def variance_k_grid(k, Pk, R_min, R_max, rtol=1e-4, order=8, n_test=16):
+    beta_ST = 4.8
+    k = np.asarray(k, dtype=np.float64)
+    Pk = np.asarray(Pk, dtype=np.float64)
+    lnk = np.log(k)
+    lnPk = np.log(Pk)
+
+    R_test = np.geomspace(R_min, R_max, n_test)
+    sigma_ref, dsigma_ref = sigma_many(k, Pk, R_test, derivative=True)
+
+    support = np.zeros(len(k), dtype=bool)
+    for R in (R_min, R_max):
+        integrand = Pk*k**3*(1+(k*R)**beta_ST)**(-2)
+        support |= integrand > 1e-3*rtol*integrand.max()
+    lnk_lo = lnk[support].min()
+    lnk_hi = lnk[support].max()
+
+    x, w = np.polynomial.legendre.leggauss(order)
+    n_panels = max(1, int(np.ceil((lnk_hi-lnk_lo)/np.log(10))))
+    while n_panels*order < len(k):
+        edges = np.linspace(lnk_lo, lnk_hi, n_panels+1)
+        half = 0.5*np.diff(edges)
+        middle = 0.5*(edges[1:]+edges[:-1])
+        lnk_nodes = (middle[:, None]+half[:, None]*x).ravel()
+        k_nodes = np.exp(lnk_nodes)
+        weights = (half[:, None]*w).ravel()*np.exp(np.interp(
+            lnk_nodes, lnk, lnPk))*k_nodes**3/(2.0*np.pi**2)
+
+        sigma, dsigma = sigma_many(
+            k_nodes, None, R_test, derivative=True, weights=weights)
+        error = max(np.max(np.abs(sigma/sigma_ref-1)),
+                    np.max(np.abs(dsigma/dsigma_ref-1)))
+        if error <= rtol:
+            return k_nodes, weights, error
+        n_panels *= 2
+
+    # No compact rule reached the target; keep the full grid
+    return k, variance_weights(k, Pk), 0.0
 
 
 class HMF:
@@ -22,7 +159,19 @@ class HMF:
         self.par1 = par1
         self.par2 = par2
         
-    def Pk(self, a, model, par1, par2):
+    """
+    Build the MGCLASS settings dictionary for a given MG model.
+
+    Parameters:
+        model (str): The MG model ('E11', 'gmu', 'DES', 'wCDM', 'nDGP', 'kmoufl').
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        dict: Settings passed to classy.Class.set().
+    """
+
+    def class_settings(self, model, par1, par2):
         common_settings = {'n_s': 0.9665,
                            'A_s': 2.101e-9,
                            'tau_reio': 0.0561,
@@ -68,17 +217,98 @@ class HMF:
             common_settings['k0_kmfl'] = par2
         else:
             raise Exception("The chosen model is not recognised")
+        return common_settings
+
+    """
+    Extract the linear matter power spectrum on the whole kvec grid at once.
+
+    Parameters:
+        M (classy.Class): A computed CLASS instance.
+        z (float or array): Redshift(s) at which P(k) is requested.
+
+    Returns:
+        numpy.ndarray: P(k) of shape (len(z), len(kvec)) in units of Mpc^3.
+    """
+
+    def Pk_array(self, M, z):
+        z = np.atleast_1d(np.asarray(z, dtype=np.float64))
+        k = np.ascontiguousarray(kvec, dtype=np.float64)
+        Pk = None
+        if hasattr(M, 'get_pk_array'):
+            try:
+                # get_pk_array returns a flat, z-major array of size len(z)*len(k)
+                Pk = np.reshape(np.asarray(M.get_pk_array(k, z, len(k), len(z), 0),
+                                           dtype=np.float64), (len(z), len(k)))
+            except (TypeError, ValueError) as error:
+                # Older classy builds expose it with another argument layout
+                logger.warning("classy get_pk_array failed (%s); extracting P(k) with pk one k at a time.",
+                               error)
+            else:
+                # A k-major layout reshapes without error, so compare one entry
+                # away from the diagonal with the scalar interface
+                if not np.isclose(Pk[-1, -2], M.pk(k[-2], z[-1]), rtol=1e-6):
+                    logger.warning("classy get_pk_array does not return a z-major P(k); "
+                                   "extracting P(k) with pk one k at a time.")
+                    Pk = None
+        if Pk is None:
+            # Scalar interface; errors of the computation itself propagate
+            Pk = [[M.pk(ki, zi) for ki in k] for zi in z]
+        return np.reshape(np.asarray(Pk, dtype=np.float64), (len(z), len(k)))
+
+    """
+    Compute the linear matter power spectrum at several redshifts from a single MGCLASS run.
+
+    Parameters:
+        z_list (array): Redshifts at which P(k) is requested (z <= z_max_pk).
+        model (str): The MG model.
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+        cache (bool, optional): Look up and store the result in the on-disk Pk_disk_cache.
+
+    Returns:
+        numpy.ndarray: P(k) over kvec of shape (len(z_list), len(kvec)).
+    """
+
+    def Pk_multi(self, z_list, model, par1, par2, cache=True):
+        settings = self.class_settings(model, par1, par2)
+        if cache:
+            key = Pk_disk_cache.key(settings, kvec, z_list)
+            Pk = Pk_disk_cache.load(key)
+            if Pk is not None:
+                return Pk
+
+        if Class is None:
+            raise Exception("classy (MGCLASS) is needed for the linear power spectrum.")
         M = Class()
-        M.set(common_settings)
+        M.set(settings)
         M.compute()
 
-        Pk = []
-        for k in kvec:
-            Pk.append(M.pk(k, 1/a-1))
+        Pk = self.Pk_array(M, z_list)
         M.empty()
         M.struct_cleanup()
+        if cache:
+            Pk_disk_cache.save(key, Pk, kvec, z_list)
         return Pk
 
+    """
+    Compute the linear matter power spectrum with MGCLASS.
+
+    Parameters:
+        a (float or array): Scale factor(s); an array returns one row per entry.
+        model (str): The MG model.
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        numpy.ndarray: P(k) over kvec, shape (len(kvec),) for a scalar a
+        and (len(a), len(kvec)) for an array of scale factors.
+    """
+
+    def Pk(self, a, model, par1, par2):
+        if hasattr(a, '__len__') and (not isinstance(a, str)):
+            return self.Pk_multi(1/np.asarray(a)-1, model, par1, par2)
+        return self.Pk_multi([1/a-1], model, par1, par2)[0]
+
     """
     for i in range(len(K0)):
         for j in tqdm(range(len(beta))):
@@ -98,6 +328,9 @@ class HMF:
     """
 
     def sigma(self, k, Pk, R):
+        if IL is None:
+            raise Exception("integration_library (Pylians) is needed for HMF.sigma; "
+                            "use sigma_many or SigmaTable instead.")
         yinit = np.array([0.0], dtype=np.float64)
         eps = 1e-13  # change this for higher/lower accuracy
         h1 = 1e-12
@@ -110,32 +343,58 @@ class HMF:
                                  h1, hmin, np.log10(k), Pk1,
                                  'sigma', verbose=False)[0])
 
-    def dSdM(self, k, Pk, rhoM, M):
-        c_ST = 3.3
-        R1 = (3.0*M/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
-        s1 = self.sigma(k, Pk, R1)
+    """
+    Compute sigma(R) and its derivative dsigma/dR in a single pass over k.
+
+    The derivative uses the analytic derivative of the window,
+    dW/dR = -beta_ST/R (kR)^beta_ST W^2, instead of a finite difference.
 
-        M2 = M*1.0001
-        R2 = (3.0*M2/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
-        s2 = self.sigma(k, Pk, R2)
+    Parameters:
+        k (array): Wavenumbers in units of 1/Mpc (log-spaced).
+        Pk (array): Linear matter power spectrum at k.
+        R (float or array): Filter radius or radii.
 
-        return (s2-s1)/(M2-M)
+    Returns:
+        tuple: sigma(R) and dsigma/dR.
+    """
+
+    def sigma_dsigma(self, k, Pk, R):
+        return sigma_many(k, Pk, R, derivative=True)
+
+    def dSdM(self, k, Pk, rhoM, M):
+        c_ST = 3.3
+        R = (3.0*M/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
+        dsigmadR = self.sigma_dsigma(k, Pk, R)[1]
+        # dR/dM = R/(3M)
+        return dsigmadR*R/(3.0*M)
 
     # Taken from https://pylians3.readthedocs.io/en/master/mass_function.html
     # And properly modified to incorporate MG theories with varying delta_c
     def ST_mass_function(self, rhoM, Masses, a, model_H, model, par1, par2, k, Pk):
+        key = (model, model_H, par1, par2, a, rhoM,
+               array_fingerprint(Masses), array_fingerprint(k, Pk))
+        dndM = HMF_cache.get(key)
+        if dndM is None:
+            dndM = self.ST_mass_function_uncached(
+                rhoM, Masses, a, model_H, model, par1, par2, k, Pk)
+            HMF_cache.set(key, dndM)
+        if isinstance(dndM, np.ndarray):
+            return dndM.copy()
+        return dndM
+
+    def ST_mass_function_uncached(self, rhoM, Masses, a, model_H, model, par1, par2, k, Pk):
         c_ST = 3.3
         deltac = delta_c(a, model, model_H, par1, par2)
         deltac = deltac.delta_c_at_ac(a, model, model_H, par1, par2)
         if hasattr(Masses, '__len__') and (not isinstance(Masses, str)):
-            dndM = np.zeros(Masses.shape[0], dtype=np.float64)
-            for i, M in enumerate(Masses):
-                R = (3.0*M/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
-                nu = (deltac/self.sigma(k, Pk, R))**2
-                dndM[i] = -(rhoM/M)*self.dSdM(k, Pk, rhoM, M) / \
-                    self.sigma(k, Pk, R)
-                dndM[i] *= 0.3222*np.sqrt(2*nu/np.pi)*(1+1/(nu**0.3))
-                dndM[i] *= np.exp(-0.5*nu)
+            Masses = np.asarray(Masses, dtype=np.float64)
+            sigma_table = SigmaTable(
+                k, Pk, rhoM, Masses.min()/1.1, Masses.max()*1.1, rtol=sigma_rtol)
+            sigma = sigma_table.sigma(Masses)
+            nu = (deltac/sigma)**2
+            dndM = -(rhoM/Masses)*sigma_table.dsigma_dM(Masses)/sigma
+            dndM *= 0.3222*np.sqrt(2*nu/np.pi)*(1+1/(nu**0.3))
+            dndM *= np.exp(-0.5*nu)
         else:
             R = (3.0*Masses/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
             nu = (deltac/self.sigma(k, Pk, R))**2
@@ -146,3 +405,81 @@ class HMF:
             dndM *= np.exp(-0.5*nu)
 
         return dndM
+
+
+"""
+Calculate the halo mass function of one cosmology (first, cosmology-dependent stage of SMF and SMD).
+
+It only depends on the cosmology and the redshift; the result is memoized
+by HMF.ST_mass_function, so that the astrophysical stages can be evaluated
+for any number of SHMR parameters without recomputing it.
+
+Parameters:
+    Masses (array): Halo masses.
+    rhoM (float): Mean matter density.
+    a (float): The scale factor.
+    model_H (str): The model of MG for H(a).
+    model (str): The model of MG for mu.
+    par1 (float): The first MG parameter.
+    par2 (float): The second MG parameter.
+    k (array): Wavenumbers of the power spectrum.
+    Pk (array): The linear power spectrum at a.
+
+Returns:
+    numpy.ndarray: dn/dM at Masses.
+"""
+
+
+def halo_stage(Masses, rhoM, a, model_H, model, par1, par2, k, Pk):
+    HMF_library = HMF(a, model, model_H, par1, par2, Masses)
+    return HMF_library.ST_mass_function(
+        rhoM, Masses, a, model_H, model, par1, par2, k, Pk)
+
+
+class SigmaTable:
+    ########################################################################
+    # Initialize a class SigmaTable (tabulated variance of the linear field)
+    # array of floats k - wavenumber in units of 1/Mpc (log-spaced)
+    # array of floats Pk - linear matter power spectrum at k
+    # float rhoM - mean matter density
+    # float M_min, M_max - range of halo masses covered by the table
+    # int n_per_decade - number of log-R nodes per decade of R
+    # float rtol - target relative error of a resampled k grid
+    #              (see variance_k_grid), None integrates over the full k
+    ########################################################################
+
+    def __init__(self, k, Pk, rhoM, M_min=1e0, M_max=1e20, n_per_decade=64, rtol=None):
+        self.rhoM = rhoM
+        self.c_ST = 3.3
+
+        lnR_min = np.log(self.R(M_min))
+        lnR_max = np.log(self.R(M_max))
+        n_R = max(int(np.ceil((lnR_max-lnR_min)/np.log(10)*n_per_decade)), 8)
+        self.lnR = np.linspace(lnR_min, lnR_max, n_R)
+
+        R = np.exp(self.lnR)
+        if rtol is None:
+            self.k_error = 0.0
+            sigma, dsigmadR = sigma_many(k, Pk, R, derivative=True)
+        else:
+            k_nodes, weights, self.k_error = variance_k_grid(
+                k, Pk, R[0], R[-1], rtol)
+            sigma, dsigmadR = sigma_many(
+                k_nodes, None, R, derivative=True, weights=weights)
+
+        self.lnsigma = scipy.interpolate.CubicSpline(self.lnR, np.log(sigma))
+        self.dlnsigma_dlnR = scipy.interpolate.CubicSpline(
+            self.lnR, R*dsigmadR/sigma)
+
+    def R(self, M):
+        return (3.0*np.asarray(M)/(4.0*np.pi*self.rhoM*self.c_ST**3))**(1.0/3.0)
+
+    def sigma(self, M):
+        return np.exp(self.lnsigma(np.log(self.R(M))))
+
+    def dlnsigma_dlnM(self, M):
+        return self.dlnsigma_dlnR(np.log(self.R(M)))/3.0
+
+    def dsigma_dM(self, M):
+        M = np.asarray(M)
+        return self.sigma(M)*self.dlnsigma_dlnM(M)/M
@@ -1,7 +1,7 @@
 from JWST_MG.constants import *
 from JWST_MG.cosmological_functions import cosmological_functions
 from JWST_MG.delta_c import delta_c
-from JWST_MG.HMF import HMF
+from JWST_MG.HMF import HMF, halo_stage
 from JWST_MG.SMF import SMF
 
 
@@ -33,119 +33,108 @@ class SMD:
         self.Masses = Masses
         self.f0 = f0
 
-    # Taken from https://hmf.readthedocs.io/en/latest/_modules/hmf/mass_function/integrate_hmf.html
-    def hmf_integral_gtm(self, M, dndm, mass_density=False):
-
-        # Eliminate NaN's
-        m = M[np.logical_not(np.isnan(dndm))]
-        dndm = dndm[np.logical_not(np.isnan(dndm))]
-        dndlnm = m * dndm
-
-        if len(m) < 4:
-            raise JWST_MG.SMD.NaNException(
+    """
+    Integrate mass functions above every mass for a batch of mass functions.
+
+    The integrand per unit ln(M) is M dn/dM, times M for mass densities and
+    times the weight if one is given. It is integrated with the trapezoidal
+    rule from every mass up to the highest finite point, and from there to
+    m_max with the power law through the last two finite points, which is
+    integrated analytically. NaNs inside a row are bridged linearly, and the
+    result is NaN wherever the integrand is NaN.
+
+    Parameters:
+        M (array): Halo masses, increasing.
+        dndm (array): Mass functions dn/dM of shape (..., len(M)).
+        weight (array, optional): Weight of the integrand, broadcast against dndm.
+        mass_density (bool, optional): Integrate M dn/dM instead of dn/dM.
+        m_max (float, optional): Upper mass of the integrals.
+
+    Returns:
+        numpy.ndarray: The integrals above every mass, shaped like dndm.
+    """
+
+    def cumulative_gtm(self, M, dndm, weight=None, mass_density=False, m_max=10**18):
+        M = np.asarray(M, dtype=np.float64)
+        dndm = np.asarray(dndm, dtype=np.float64)
+        shape = np.broadcast_shapes(dndm.shape, np.shape(M))
+        f = M*dndm
+        if mass_density:
+            f = M*f
+        if weight is not None:
+            f = f*weight
+        f = np.broadcast_to(f, shape).reshape(-1, len(M))
+        valid = np.logical_not(np.isnan(f))
+
+        n_valid = np.sum(valid, axis=-1)
+        if np.any(n_valid < 4):
+            raise NaNException(
                 "There are too few real numbers in dndm: len(dndm) = %s, #NaN's = %s"
-                % (len(M), len(M) - len(dndm))
-            )
-
-        # Calculate the mass function (and its integral) from the highest M up to 10**18
-        if m[-1] < m[0] * 10**18 / m[3]:
-            m_upper = np.arange(
-                np.log(m[-1]), np.log(10**18), np.log(m[1]) - np.log(m[0])
+                % (len(M), len(M) - np.min(n_valid))
             )
-            mf_func = spline(np.log(m), np.log(dndlnm), k=1)
-            mf = mf_func(m_upper)
-
-            if not mass_density:
-                int_upper = intg.simps(
-                    np.exp(mf), dx=m_upper[2] - m_upper[1], even="first")
-            else:
-                int_upper = intg.simps(
-                    np.exp(m_upper + mf), dx=m_upper[2] - m_upper[1], even="first"
-                )
-        else:
-            int_upper = 0
-
-        # Calculate the cumulative integral (backwards) of [m*]dndlnm
-        if not mass_density:
-            ngtm = np.concatenate(
-                (
-                    intg.cumtrapz(
-                        dndlnm[::-1], dx=np.log(m[1]) - np.log(m[0]))[::-1],
-                    np.zeros(1),
-                )
-            )
-        else:
-            ngtm = np.concatenate(
-                (
-                    intg.cumtrapz(m[::-1] * dndlnm[::-1], dx=np.log(m[1]) - np.log(m[0]))[
-                        ::-1
-                    ],
-                    np.zeros(1),
-                )
-            )
-
-        return ngtm + int_upper
-
-     # Taken from https://hmf.readthedocs.io/en/latest/_modules/hmf/mass_function/integrate_hmf.html
-    def sfr_integral_gtm(self, M, dndm, SFR, mass_density=False):
 
-        # Eliminate NaN's
-        m = M[np.logical_not(np.isnan(dndm))]
-        dndm = dndm[np.logical_not(np.isnan(dndm))]
-        dndlnm = m * dndm
-        sfr = SFR[np.logical_not(np.isnan(dndm))]
+        # Previous and next finite point of every mass
+        lnm = np.log(M)
+        index = np.arange(len(M))
+        rows = np.arange(len(f))[:, None]
+        previous = np.maximum.accumulate(np.where(valid, index, 0), axis=-1)
+        following = np.minimum.accumulate(
+            np.where(valid, index, len(M)-1)[:, ::-1], axis=-1)[:, ::-1]
+        first = np.argmax(valid, axis=-1)[:, None]
+        last = len(M)-1 - np.argmax(valid[:, ::-1], axis=-1)[:, None]
+        previous = np.maximum(previous, first)
+        following = np.minimum(following, last)
+
+        # Bridge the NaNs linearly in ln(M) and drop everything above the last point
+        span = lnm[following]-lnm[previous]
+        w = np.where(span > 0, (lnm-lnm[previous])/np.where(span > 0, span, 1), 0)
+        f = (1-w)*f[rows, previous] + w*f[rows, following]
+        segments = 0.5*(f[:, 1:]+f[:, :-1])*np.diff(lnm)
+        segments[index[1:] > last] = 0
+        gtm = np.concatenate((np.cumsum(segments[:, ::-1], axis=-1)[:, ::-1],
+                              np.zeros((len(f), 1))), axis=-1)
+
+        # Power-law tail from the last finite point up to m_max
+        f_last = f[rows, last][:, 0]
+        f_prev = f[rows, previous[rows, last-1]][:, 0]
+        x_last = lnm[last][:, 0]
+        length = np.maximum(np.log(m_max)-x_last, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.log(f_last/f_prev)/(x_last-lnm[previous[rows, last-1]][:, 0])
+            tail = np.where(np.abs(slope*length) > 1e-8,
+                            f_last*np.expm1(slope*length)/slope, f_last*length)
+        tail = np.where(np.isfinite(tail) & (f_last > 0), tail, 0)
+
+        gtm = gtm + tail[:, None]
+        gtm[np.logical_not(valid)] = np.nan
+        return gtm.reshape(shape)
+
+    # Adapted from https://hmf.readthedocs.io/en/latest/_modules/hmf/mass_function/integrate_hmf.html
+    def hmf_integral_gtm(self, M, dndm, mass_density=False):
+        return self.cumulative_gtm(M, dndm, mass_density=mass_density)
 
-        if len(m) < 4:
-            raise JWST_MG.SMD.NaNException(
-                "There are too few real numbers in dndm: len(dndm) = %s, #NaN's = %s"
-                % (len(M), len(M) - len(dndm))
-            )
+    """
+    Calculate the stellar mass density above M* for a batch of halo mass functions.
 
-        # Calculate the mass function (and its integral) from the highest M up to 10**18
-        if m[-1] < m[0] * 10**18 / m[3]:
-            m_upper = np.arange(
-                np.log(m[-1]), np.log(10**18), np.log(m[1]) - np.log(m[0])
-            )
-            mf_func = spline(np.log(m), np.log(dndlnm), k=1)
-            mf = mf_func(m_upper)
-
-            if not mass_density:
-                int_upper = intg.simps(
-                    np.exp(mf), dx=m_upper[2] - m_upper[1], even="first")
-            else:
-                int_upper = intg.simps(
-                    np.exp(m_upper + mf), dx=m_upper[2] - m_upper[1], even="first"
-                )
-        else:
-            int_upper = 0
-
-        # Calculate the cumulative integral (backwards) of [m*]dndlnm
-        if not mass_density:
-            ngtm = np.concatenate(
-                (
-                    intg.cumtrapz(
-                        dndlnm[::-1], dx=np.log(m[1]) - np.log(m[0]))[::-1],
-                    np.zeros(1),
-                )
-            )
-        else:
-            ngtm = np.concatenate(
-                (
-                    intg.cumtrapz(m[::-1] * dndm[::-1] * sfr, dx=np.log(m[1]) - np.log(m[0]))[
-                        ::-1
-                    ],
-                    np.zeros(1),
-                )
-            )
+    Parameters:
+        Masses (array): Halo masses.
+        HMF_fid (array): Halo mass functions of shape (..., len(Masses)).
+        a (float): The scale factor.
+        model_SFR (str): The model of the SHMR.
+        f0 (float): The parameter of the 'double_power' SHMR.
 
-        return ngtm + int_upper
+    Returns:
+        tuple: Stellar masses and stellar mass densities, both shaped like HMF_fid.
+    """
 
-    def SMD(self, Masses, rhoM, a, model_H, model, model_SFR, par1, par2, k, Pk, f0):
-        HMF_library = HMF(a, model, model_H, par1, par2, Masses)
-        HMF_fid = HMF_library.ST_mass_function(
-            rhoM, Masses, a, model_H, model, par1, par2, k, Pk)
-        SMF_library = SMF(a, model, model_H, model_SFR, par1, par2, Masses, f0)
+    def SMD_from_HMF(self, Masses, HMF_fid, a, model_SFR, f0):
+        SMF_library = SMF(a, self.model, self.model_H, model_SFR, self.par1, self.par2, Masses, f0)
         fstar = SMF_library.epsilon(Masses, model_SFR, a, f0)*Omegab0/Omegam0
         SMD_fid = fstar * \
-            self.hmf_integral_gtm(Masses, HMF_fid, mass_density=True)
-        return fstar*Masses, SMD_fid
+            self.cumulative_gtm(Masses, HMF_fid, mass_density=True)
+        return np.broadcast_to(fstar*Masses, SMD_fid.shape), SMD_fid
+
+    def SMD(self, Masses, rhoM, a, model_H, model, model_SFR, par1, par2, k, Pk, f0):
+        HMF_fid = halo_stage(
+            Masses, rhoM, a, model_H, model, par1, par2, k, Pk)
+        return self.SMD_from_HMF(Masses, HMF_fid, a, model_SFR, f0)
@@ -1,29 +1,23 @@
 from JWST_MG.constants import *
 from JWST_MG.cosmological_functions import cosmological_functions
 from JWST_MG.delta_c import delta_c
-from JWST_MG.HMF import HMF
+from JWST_MG.HMF import HMF, halo_stage
 
-class SMF:
-   ########################################################################
-    # Initialize a class SMF (Stellar Mass Function)
-    # float a - scale factor value (related to redshift via a = 1/(1+z))
-    # string model - model of MG for the derivation of mu parameter
-    # string model_H - model of MG for H(a)
-    # string model_SFR - model that determines SMHR
-    # float par1, par2 - corresponding MG parameters
-    # Masses - array of CDM halo masses
-    # f0 - parameter for "double-power" SMHR, otherwise None
+class SHMR:
+    ########################################################################
+    # Initialize a class SHMR (stellar-to-halo mass relation epsilon_*(Mh, z))
+    # string model_SFR - model that determines SMHR ('phenomenological_extreme',
+    #                    'phenomenological_regular', 'toy', 'Puebla' or 'double_power')
+    #
+    # All methods broadcast over their arguments with the usual NumPy rules,
+    # e.g. f0[:, None, None], Mh[None, :, None] and z[None, None, :] give the
+    # relation for every (parameter set, halo mass, redshift) in one call.
     ########################################################################
 
-    def __init__(self, a, model, model_H, model_SFR, par1, par2, Masses, f0=None):
-        self.a = a
-        self.model = model
-        self.model_H = model_H
+    def __init__(self, model_SFR):
+        if model_SFR not in ('phenomenological_extreme', 'phenomenological_regular', 'toy', 'Puebla', 'double_power'):
+            raise Exception("Incorrect SFR model used.")
         self.model_SFR = model_SFR
-        self.par1 = par1
-        self.par2 = par2
-        self.Masses = Masses
-        self.f0 = f0
 
     # Rodriguez-Puebla parameterization is taken from
     # the repo https://github.com/dr-guangtou/asap/blob/master/asap/shmr.py
@@ -56,12 +50,13 @@ class SMF:
         delta_0, delta_1, delta_2 = 3.390, -0.472, -0.931
         gamma_0, gamma_1 = 0.498, -0.157
 
-        mh_1 = mh_1_0 + self.puebla17_p(mh_1_1, mh_1_2, redshift) * self.puebla17_q(redshift)
-        epsilon = epsilon_0 + (self.puebla17_p(epsilon_1, epsilon_2, redshift) * self.puebla17_q(redshift) +
+        q = self.puebla17_q(redshift)
+        mh_1 = mh_1_0 + self.puebla17_p(mh_1_1, mh_1_2, redshift) * q
+        epsilon = epsilon_0 + (self.puebla17_p(epsilon_1, epsilon_2, redshift) * q +
                             self.puebla17_p(epsilon_3, 0.0, redshift))
-        alpha = alpha_0 + self.puebla17_p(alpha_1, alpha_2, redshift) * self.puebla17_q(redshift)
-        delta = delta_0 + self.puebla17_p(delta_1, delta_2, redshift) * self.puebla17_q(redshift)
-        gamma = gamma_0 + self.puebla17_p(gamma_1, 0.0, redshift) * self.puebla17_q(redshift)
+        alpha = alpha_0 + self.puebla17_p(alpha_1, alpha_2, redshift) * q
+        delta = delta_0 + self.puebla17_p(delta_1, delta_2, redshift) * q
+        gamma = gamma_0 + self.puebla17_p(gamma_1, 0.0, redshift) * q
 
         return mh_1, epsilon, alpha, delta, gamma
 
@@ -76,28 +71,90 @@ class SMF:
         Mstar = 10**Mstar
         epsilon_star = Mstar/(Mh*Omegab0/Omegam0)
         return epsilon_star
-        
-    def epsilon(self, Mh, model_SFR, a, f0):
-        z = 1/a-1
-        if model_SFR == 'phenomenological_extreme':
-            epstar = 1
-        elif model_SFR == 'phenomenological_regular':
-            if z >= 6 and z <= 10:
-                epstar = 0.15-0.03*(z-6)
-            else:
-                epstar = 0.03
-        elif model_SFR == 'toy':
-            epstar = f0
-        elif model_SFR == 'Puebla':
+
+    """
+    Calculate the star formation efficiency epsilon_*.
+
+    Parameters:
+        Mh (float or array): Halo masses.
+        z (float or array): Redshifts.
+        f0 (float or array, optional): Amplitude of the 'toy' and
+            'double_power' relations.
+
+    Returns:
+        numpy.ndarray: epsilon_* broadcast over Mh, z and f0.
+
+    Raises:
+        ValueError: If f0 is not given for the 'toy' or 'double_power' relation.
+    """
+
+    def epsilon(self, Mh, z, f0=None):
+        Mh = np.asarray(Mh, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        if f0 is None and self.model_SFR in ['toy', 'double_power']:
+            raise ValueError("The '%s' SFR model needs f0." % self.model_SFR)
+        if self.model_SFR == 'phenomenological_extreme':
+            epstar = np.ones(())
+        elif self.model_SFR == 'phenomenological_regular':
+            epstar = np.where((z >= 6) & (z <= 10), 0.15-0.03*(z-6), 0.03)
+        elif self.model_SFR == 'toy':
+            epstar = np.asarray(f0, dtype=np.float64)
+        elif self.model_SFR == 'Puebla':
             epstar = self.puebla17_mh_to_ms(Mh, z)
-        elif model_SFR == 'double_power':
+        elif self.model_SFR == 'double_power':
             Mp = 10**12.1
             alo = -1.32
             ahi = 0.43
-            epstar = f0/((Mh/Mp)**(alo) + (Mh/Mp)**(ahi))
-        else:
-            raise Exception("Incorrect SFR model used.")
-        return epstar
+            epstar = np.asarray(f0)/((Mh/Mp)**(alo) + (Mh/Mp)**(ahi))
+        # Every relation has the same shape, also those that do not depend on f0
+        if f0 is None:
+            return np.broadcast_to(epstar, np.broadcast(Mh, z).shape)
+        return np.broadcast_to(epstar, np.broadcast(Mh, z, f0).shape)
+
+    """
+    Calculate the stellar masses of halos.
+
+    Parameters:
+        Mh (float or array): Halo masses.
+        z (float or array): Redshifts.
+        f0 (float or array, optional): Amplitude of the 'toy' and
+            'double_power' relations.
+
+    Returns:
+        numpy.ndarray: M* = epsilon_* Omegab0/Omegam0 Mh broadcast over Mh, z and f0.
+    """
+
+    def Mstar(self, Mh, z, f0=None):
+        return self.epsilon(Mh, z, f0)*Omegab0/Omegam0*np.asarray(Mh)
+
+
+class SMF:
+   ########################################################################
+    # Initialize a class SMF (Stellar Mass Function)
+    # float a - scale factor value (related to redshift via a = 1/(1+z))
+    # string model - model of MG for the derivation of mu parameter
+    # string model_H - model of MG for H(a)
+    # string model_SFR - model that determines SMHR
+    # float par1, par2 - corresponding MG parameters
+    # Masses - array of CDM halo masses
+    # f0 - parameter for "double-power" SMHR, otherwise None
+    ########################################################################
+
+    def __init__(self, a, model, model_H, model_SFR, par1, par2, Masses, f0=None):
+        self.a = a
+        self.model = model
+        self.model_H = model_H
+        self.model_SFR = model_SFR
+        self.par1 = par1
+        self.par2 = par2
+        self.Masses = Masses
+        self.f0 = f0
+
+    def puebla17_mh_to_ms(self, Mh, z):
+        return SHMR('Puebla').puebla17_mh_to_ms(Mh, z)
+
+    def epsilon(self, Mh, model_SFR, a, f0):
+        return SHMR(model_SFR).epsilon(Mh, 1/a-1, f0)
 
     def sigma_P(self, z):
         sigma0 = 0.1
@@ -115,16 +172,100 @@ class SMF:
     def SMF_interpolation(self, Mstar_var, SMF, z, down, up):
         return scipy.integrate.quad(lambda logx: self.G_prob(10**logx, Mstar_var, z)*SMF(10**logx), down, up)[0]
 
-    def SMF_obs(self, Masses, rhoM, a, model_H, model, model_SFR, par1, par2, k, Pk, f0):
-        HMF_library = HMF(a, model, model_H, par1, par2, Masses)
-        HMF_fid = HMF_library.ST_mass_function(
-            rhoM, Masses, a, model_H, model, par1, par2, k, Pk)
+    """
+    Convolve an SMF with the lognormal scatter in M* for a whole grid of M* at once.
+
+    The SMF is sampled on a uniform log10(M*) grid between down and up, with
+    a spacing of sigma/20, and the Gaussian kernel in log10(M*) is applied
+    as one matrix product with trapezoid weights. This is the discretized
+    version of SMF_interpolation for every point of Mstar_grid.
+
+    With shifts, the convolution is returned for each SMF(M*/10**shift) at
+    once; their sampling grids are the shifted grid of SMF, so every row
+    equals the unshifted call on the shifted SMF and limits.
+
+    Parameters:
+        Mstar_grid (array): Stellar masses at which the convolved SMF is returned.
+        SMF (callable): The intrinsic SMF as a function of M*.
+        z (float): The redshift.
+        down (float): Lower limit of log10(M*) of the intrinsic SMF.
+        up (float): Upper limit of log10(M*) of the intrinsic SMF.
+        sigma (float, optional): Scatter in dex, sigma_P(z) by default.
+        shifts (array, optional): Offsets of the SMF in log10(M*).
+
+    Returns:
+        numpy.ndarray: The convolved SMF at Mstar_grid, with a leading axis
+        over shifts if given.
+    """
+
+    def SMF_convolution(self, Mstar_grid, SMF, z, down, up, sigma=None, shifts=None):
+        if sigma is None:
+            sigma = self.sigma_P(z)
+        n_x = int(np.ceil(20*(up-down)/sigma))+1
+        logx = np.linspace(down, up, n_x)
+        weights = np.full(n_x, (up-down)/(n_x-1))
+        weights[[0, -1]] /= 2
+        weighted_SMF = weights*SMF(10**logx)
+        if shifts is None:
+            kernel = 1/np.sqrt(2*np.pi*sigma**2)*np.exp(-1/(2*sigma**2) *
+                                                        (np.log10(Mstar_grid)[:, None]-logx[None, :])**2)
+            return kernel @ weighted_SMF
+
+        shifts = np.asarray(shifts, dtype=np.float64)
+        SMF_conv = np.empty((len(shifts), len(Mstar_grid)))
+        # Bound the size of the kernel block held in memory
+        chunk_size = max(1, 2**21//(len(Mstar_grid)*n_x))
+        for start in range(0, len(shifts), chunk_size):
+            y = np.log10(Mstar_grid)[None, :, None] - \
+                shifts[start:start+chunk_size, None, None]
+            kernel = 1/np.sqrt(2*np.pi*sigma**2) * \
+                np.exp(-1/(2*sigma**2)*(y-logx[None, None, :])**2)
+            SMF_conv[start:start+chunk_size] = kernel @ weighted_SMF
+        return SMF_conv
+
+    """
+    Map a halo mass function to the observed SMF (second, astrophysical stage).
+
+    For 'double_power' an array of f0 is evaluated at once: M* is
+    proportional to f0, so the SMF for each f0 is the f0 = 1 SMF shifted by
+    log10(f0) in log10(M*) and all of them are convolved in one batch. For
+    'toy' and the phenomenological relations the SMF is broadcast over f0
+    directly, and for 'Puebla', which does not depend on f0, the single SMF
+    is repeated along the f0 axis.
+
+    Parameters:
+        Masses (array): Halo masses.
+        HMF_fid (array): dn/dM at Masses from halo_stage.
+        a (float): The scale factor.
+        model_SFR (str): The model that determines SMHR.
+        f0 (float or array): Parameter of the 'toy' and 'double_power' SMHR.
+        sigma (float, optional): Scatter in dex, sigma_P(z) by default.
+
+    Returns:
+        tuple: Stellar masses and the SMF; for an array of f0 the SMF (and for
+        'toy' and the phenomenological relations also the stellar masses) gain
+        a leading axis over f0.
+    """
+
+    def stellar_stage(self, Masses, HMF_fid, a, model_SFR, f0, sigma=None):
+        shifts = None
+        n_f0 = None
+        if model_SFR == 'double_power' and np.ndim(f0) > 0:
+            shifts = np.log10(f0)
+            f0 = 1
+        elif model_SFR == 'Puebla' and np.ndim(f0) > 0:
+            # Puebla does not depend on f0, and its convolution needs one
+            # grid of M*
+            n_f0 = len(f0)
+            f0 = None
+        elif np.ndim(f0) > 0:
+            f0 = np.asarray(f0)[:, None]
 
         Masses_star = self.epsilon(
             Masses, model_SFR, a, f0)*Omegab0/Omegam0*Masses
         # varepsilon(Mh_arr,model_SFR,a)
         SMF = Masses_star*np.log(10)*HMF_fid*np.gradient(Masses)/ \
-            np.gradient(Masses_star)
+            np.gradient(Masses_star, axis=-1)
 
         if model_SFR == 'Puebla' or model_SFR == 'double_power':
             z = 1/a-1
@@ -139,10 +280,8 @@ class SMF:
 
             SMF = scipy.interpolate.interp1d(Masses_star,SMF, fill_value="extrapolate")
             Mstar_grid = np.logspace(6,13,150)
-            SMF_arr = []
-            for Mstar in Mstar_grid:
-                SMF_arr.append(self.SMF_interpolation(Mstar, SMF, z,np.log10(min(Masses_star)),np.log10(max(Masses_star))))
-            SMF = c*np.array(SMF_arr)
+            SMF = c*self.SMF_convolution(Mstar_grid, SMF, z, np.log10(
+                min(Masses_star)), np.log10(max(Masses_star)), sigma, shifts)
             Masses_star = Mstar_grid
             #SMF = scipy.interpolate.interp1d(Masses_star,SMF, fill_value="extrapolate")
             #SMF = self.f_passive_obs(Masses_star,a)*SMF(Masses_star*10**(-mu_SMF))+SMF(Masses_star*10**(-mu_SMF))*(1-self.f_passive_obs(Masses_star*10**(-kappa_SMF),a))
@@ -156,4 +295,11 @@ class SMF:
         SMF = self.f_passive_obs(Masses_star,a)*SMF(Masses_star*10**(-mu_SMF))+SMF(Masses_star*10**(-mu_SMF))*(1-self.f_passive_obs(Masses_star*10**(-kappa_SMF),a))
         SMF = c*SMF
         """
+        if n_f0 is not None:
+            SMF = np.broadcast_to(SMF, (n_f0,)+np.shape(SMF))
         return Masses_star, SMF
+
+    def SMF_obs(self, Masses, rhoM, a, model_H, model, model_SFR, par1, par2, k, Pk, f0, sigma=None):
+        HMF_fid = halo_stage(
+            Masses, rhoM, a, model_H, model, par1, par2, k, Pk)
+        return self.stellar_stage(Masses, HMF_fid, a, model_SFR, f0, sigma)
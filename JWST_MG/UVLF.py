@@ -1,7 +1,7 @@
 from JWST_MG.constants import *
 from JWST_MG.cosmological_functions import cosmological_functions
 from JWST_MG.delta_c import delta_c
-from JWST_MG.HMF import HMF
+from JWST_MG.HMF import HMF, sigma_many
 from JWST_MG.SMF import SMF
 from JWST_MG.SMD import SMD
 
@@ -37,31 +37,23 @@ class UVLF:
         z = 1/a-1
         c_ST = 3.3
         deltac = deltac_library.delta_c_at_ac(1, model, model_H, par1, par2)
-        lineardelta_z0 = deltac_library.linear(
-            1e-5, 1, model_H, model, par1, par2)[-1, 1]
-        lineardelta = scipy.interpolate.interp1d(deltac_library.linear(1e-5, 1, model_H, model, par1, par2)[
-                                                 :, 0], deltac_library.linear(1e-5, 1, model_H, model, par1, par2)[:, 1]/lineardelta_z0, fill_value='extrapolate')
-        z_arr = np.linspace(0, 1, 50)
-        dlineardz = np.gradient(lineardelta(1/(1+z_arr)))/np.gradient(z_arr)
-        dlineardz_interp = scipy.interpolate.interp1d(
-            z_arr, dlineardz, fill_value='extrapolate')
-        dlineardz0 = dlineardz_interp(0)
-        alpha = []
-        beta = []
+        # dD/dz at z = 0 with D(z = 0) = 1
+        dlineardz0 = -cosmological_library.growth_rate(
+            1, model, model_H, par1, par2)
         Masses = np.logspace(8, 16, 500)
         k = kvec/h
         Pk = np.array(Pk_library.Pk(1, model, par1, par2))*h**3
-        for Mh0 in Masses:
-            zf = -0.0064*(np.log10(Mh0))**2+0.0237*np.log10(Mh0) + 1.8837
-            q = 4.137*zf**(-0.9476)
-            R_M0 = (3.0*Mh0/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
-            R_M0q = (3.0*(Mh0/q)/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
+        zf = -0.0064*(np.log10(Masses))**2+0.0237*np.log10(Masses) + 1.8837
+        q = 4.137*zf**(-0.9476)
+        R_M0 = (3.0*Masses/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
+        R_M0q = (3.0*(Masses/q)/(4.0*np.pi*rhoM*c_ST**3))**(1.0/3.0)
 
-            func_EPS = 1/(np.sqrt(Pk_library.sigma(k, Pk, R_M0q)
-                          ** 2-Pk_library.sigma(k, Pk, R_M0)**2))
+        # sigma at both radii for all masses in one batched pass
+        sigma_M0, sigma_M0q = sigma_many(k, Pk, np.array([R_M0, R_M0q]))
+        func_EPS = 1/(np.sqrt(sigma_M0q**2-sigma_M0**2))
 
-            alpha.append((deltac*np.sqrt(2/np.pi)*dlineardz0+1)*func_EPS)
-            beta.append(-func_EPS)
+        alpha = (deltac*np.sqrt(2/np.pi)*dlineardz0+1)*func_EPS
+        beta = -func_EPS
 
         alpha = scipy.interpolate.interp1d(
             Masses, alpha, fill_value='extrapolate')
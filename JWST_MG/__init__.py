@@ -1,8 +1,11 @@
 from . import constants
+from . import cache
+from . import kmoufl
 from . import cosmological_functions
 from . import delta_c
 from . import HMF
 from . import SMF
 from . import SMD
 from . import UVLF
+from . import GSMF_data
 from . import reionization
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import OrderedDict
+from JWST_MG.constants import *
+
+logger = logging.getLogger(__name__)
+
+"""
+Hash the contents of one or more arrays into a short, hashable fingerprint.
+
+Parameters:
+    *arrays (array or float): Arrays (or scalars) to fingerprint.
+
+Returns:
+    str: Hex digest depending on the shape, dtype and values of all inputs.
+"""
+
+
+def array_fingerprint(*arrays):
+    digest = hashlib.sha1()
+    for x in arrays:
+        x = np.ascontiguousarray(x)
+        digest.update(str((x.shape, x.dtype.str)).encode())
+        digest.update(x.tobytes())
+    return digest.hexdigest()
+
+
+"""
+Identify the installed classy (MGCLASS) build.
+
+Returns:
+    str: The version of the classy module and the modification time of its
+        file, either of which is None when unavailable.
+"""
+
+
+def class_version():
+    try:
+        mtime = os.path.getmtime(classy.__file__)
+    except (AttributeError, TypeError, OSError):
+        mtime = None
+    return '%s %s' % (getattr(classy, '__version__', None), mtime)
+
+
+class LRU_cache:
+    ########################################################################
+    # Initialize a class LRU_cache (bounded in-process memoization table)
+    # int maxsize - maximum number of entries kept before the least
+    #               recently used one is dropped
+    ########################################################################
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def get(self, key):
+        if key not in self.data:
+            return None
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+
+class Pk_cache:
+    ########################################################################
+    # Initialize a class Pk_cache (persistent cache of MGCLASS power spectra)
+    # string path - directory holding the cached .npz files
+    #               (defaults to $JWST_MG_CACHE_DIR or ~/.cache/JWST_MG)
+    # float max_size - maximum total size of the cache in bytes
+    #                  (defaults to $JWST_MG_CACHE_SIZE or 2 GB, 0 disables it)
+    ########################################################################
+
+    def __init__(self, path=None, max_size=None):
+        if path is None:
+            path = os.environ.get('JWST_MG_CACHE_DIR', os.path.join(
+                os.path.expanduser('~'), '.cache', 'JWST_MG'))
+        if max_size is None:
+            max_size = float(os.environ.get('JWST_MG_CACHE_SIZE', 2e9))
+        self.path = path
+        self.max_size = max_size
+        # Age in seconds after which leftover .tmp files are removed
+        self.tmp_max_age = 600
+        # Running total of the cache size in bytes as seen by this process;
+        # None until the first eviction has scanned the directory
+        self.size = None
+        self.save_failed_logged = False
+        self.class_version = class_version()
+
+    """
+    Build a content-addressed key from the CLASS settings and the requested grids.
+
+    The version of the installed classy module is part of the key, so that
+    rebuilding MGCLASS does not return spectra of the previous build.
+
+    Parameters:
+        settings (dict): The full settings dictionary passed to classy.
+        k (array): Wavenumbers at which P(k) is extracted.
+        z (array): Redshifts at which P(k) is extracted.
+
+    Returns:
+        str: Hex digest identifying the power spectrum table.
+    """
+
+    def key(self, settings, k, z):
+        digest = hashlib.sha256()
+        digest.update(self.class_version.encode())
+        digest.update(json.dumps(settings, sort_keys=True, default=float).encode())
+        digest.update(np.ascontiguousarray(k, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(
+            np.atleast_1d(z), dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    """
+    Load a cached power spectrum table.
+
+    Parameters:
+        key (str): Key returned by Pk_cache.key.
+
+    Returns:
+        numpy.ndarray or None: The cached P(k) table, or None on a miss. A
+        damaged entry counts as a miss and is removed.
+    """
+
+    def load(self, key):
+        if self.max_size <= 0:
+            return None
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as data:
+                Pk = data['Pk']
+            # Refresh the modification time, which orders the LRU eviction
+            os.utime(filename)
+        except (zipfile.BadZipFile, zlib.error, EOFError, ValueError, KeyError):
+            # A truncated or corrupt entry would fail on every later run
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return None
+        except OSError:
+            return None
+        return Pk
+
+    """
+    Store a power spectrum table and evict the least recently used entries.
+
+    The file is written to a temporary name in the cache directory and then
+    atomically renamed, so concurrent pool workers never see partial files.
+    The directory is only scanned for eviction on the first save of the
+    process and whenever the running size total exceeds max_size. A cache
+    that cannot be written (read-only or full disk) is logged once and
+    otherwise ignored.
+
+    Parameters:
+        key (str): Key returned by Pk_cache.key.
+        Pk (array): The P(k) table to store.
+        k (array): Wavenumbers of the table.
+        z (array): Redshifts of the table.
+    """
+
+    def save(self, key, Pk, k, z):
+        if self.max_size <= 0:
+            return
+        tmpname = None
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.path, suffix='.tmp', delete=False) as f:
+                tmpname = f.name
+                np.savez_compressed(f, Pk=Pk, k=k, z=np.atleast_1d(z))
+            size = os.path.getsize(tmpname)
+            os.replace(tmpname, self.filename(key))
+            tmpname = None
+            if self.size is None or self.size + size > self.max_size:
+                self.evict()
+            else:
+                self.size += size
+        except OSError as error:
+            if not self.save_failed_logged:
+                self.save_failed_logged = True
+                logger.warning("Could not write the P(k) cache in %s (%s); "
+                               "continuing without it.", self.path, error)
+        finally:
+            # Do not leave partial files behind (disk full, interrupted worker)
+            if tmpname is not None:
+                try:
+                    os.remove(tmpname)
+                except OSError:
+                    pass
+
+    def evict(self):
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.path):
+            if name.endswith('.tmp'):
+                # Temporary files of killed workers; recent ones may still be written
+                filename = os.path.join(self.path, name)
+                try:
+                    if now - os.stat(filename).st_mtime > self.tmp_max_age:
+                        os.remove(filename)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                # Another worker removed it first
+                pass
+            total -= size
+        self.size = total
+
+
+Pk_disk_cache = Pk_cache()
@@ -6,14 +6,25 @@ import math
 import matplotlib
 import numpy as np
 from numpy import inf
-from classy import Class
+try:
+    import classy
+    from classy import Class
+except ImportError:
+    # MGCLASS is only needed for the linear power spectra (HMF.Pk_multi) and
+    # the k-mouflage tables; the rest of the package works without it
+    classy = None
+    Class = None
 from scipy.optimize import fsolve
 import math
 import scipy
 from tqdm import tqdm
-import integration_library as IL
+try:
+    import integration_library as IL
+except ImportError:
+    # Pylians is only needed for the odeint sigma(R) of HMF.sigma; the
+    # vectorized variance integrals do not use it
+    IL = None
 from scipy.interpolate import interp1d
-import classy
 import sys
 from scipy.interpolate import InterpolatedUnivariateSpline as spline
 import pandas as pd
@@ -83,18 +94,12 @@ alpha_B = 2.5*1e-13
 sigma_T = 6.6525e-25
 
 kvec = np.logspace(np.log10(0.000001), np.log10(1000.0), 10000)
+# Target relative error of sigma(R) on the resampled k grid, None for the full kvec
+sigma_rtol = 1e-4
 delta_ini = np.logspace(-5, 0, 100000)
 abs_err = 1e-5
 ai = 1e-5
 beta_arr = np.linspace(0, 0.5, 15)
 K0_arr = np.linspace(0.1, 1, 15)
 
-H_arr_kmoufl = np.zeros(shape=(15, 15), dtype=object)
-dH_arr_kmoufl = np.zeros(shape=(15, 15), dtype=object)
-H_int_kmoufl = np.zeros(shape=(15, 15), dtype=object)
-dH_int_kmoufl = np.zeros(shape=(15, 15), dtype=object)
-
 M = {}
-path = os.path.dirname(os.path.realpath(__file__))
-kmoufl_H = np.load(path  + "/kmoufl_H.npy", allow_pickle=True)
-kmoufl_dH = np.load(path + "/kmoufl_dH.npy", allow_pickle=True)
@@ -1,6 +1,172 @@
 # Import some constants that are shared between all files
 # Namely H0, Omegam0, Omegar0 etc.
 from JWST_MG.constants import *
+from JWST_MG.cache import LRU_cache
+from JWST_MG.kmoufl import get_kmoufl_background
+
+# Dense linear growth solutions keyed by (model, model_H, par1, par2)
+growth_cache = LRU_cache(maxsize=64)
+# Model-specialized background kernels keyed by (model, model_H, par1, par2)
+kernel_cache = LRU_cache(maxsize=256)
+
+
+"""
+Build a fast evaluator of a cubic spline through tabulated columns on a uniform grid.
+
+The spline coefficients are evaluated with Horner's scheme on the uniform
+grid, which avoids the per-call overhead of CubicSpline.__call__ inside the
+ODE solvers.
+
+Parameters:
+    x (array): Uniformly spaced nodes (e.g. ln(a)).
+    columns (list): Arrays tabulated at x.
+
+Returns:
+    callable: f(x) for a scalar x returning the interpolated columns.
+"""
+
+
+def uniform_spline(x, columns):
+    n_x = len(x)
+    polynomials = scipy.interpolate.CubicSpline(x, np.transpose(columns)).c
+    x_min = x[0]
+    inverse_step = (n_x-1)/(x[-1]-x[0])
+
+    def evaluate(x_eval):
+        i = min(max(int((x_eval-x_min)*inverse_step), 0), n_x-2)
+        t = x_eval-x[i]
+        p = polynomials[:, i]
+        return ((p[0]*t+p[1])*t+p[2])*t+p[3]
+    return evaluate
+
+
+class background_kernel:
+    ########################################################################
+    # Initialize a class background_kernel (H(a), dH/da and mu(a) specialized
+    # to one cosmology; the model branches and the constant subexpressions are
+    # resolved here once instead of on every call)
+    # string model - model of MG for the derivation of mu parameter
+    # string model_H - model of MG for H(a)
+    # float par1, par2 - corresponding MG parameters
+    ########################################################################
+
+    def __init__(self, model, model_H, par1, par2):
+        self.model = model
+        self.model_H = model_H
+        self.par1 = par1
+        self.par2 = par2
+
+        OmegaL0 = 1-Omegam0-Omegar0
+        if model_H == 'LCDM':
+            def H_dH(a):
+                matter = Omegam0/a**3
+                radiation = Omegar0/a**4
+                E = np.sqrt(OmegaL0+matter+radiation)
+                return H0*E, -H0*(3*matter+4*radiation)/(2*a*E)
+        elif model_H == 'wCDM':
+            wL = par1
+
+            def H_dH(a):
+                matter = Omegam0/a**3
+                radiation = Omegar0/a**4
+                dark_energy = OmegaL0*a**(-3*(1+wL))
+                E = np.sqrt(dark_energy+matter+radiation)
+                return H0*E, -H0*(3*(1+wL)*dark_energy+3*matter+4*radiation)/(2*a*E)
+        elif model_H == 'nDGP':
+            rc = par1/c
+            sqrt_Omegarc = 1/(2*H0*rc)
+            OmegaLambda0 = 1 - Omegam0 - Omegar0 + 2*sqrt_Omegarc
+            constant = OmegaLambda0+sqrt_Omegarc**2
+
+            def H_dH(a):
+                matter = Omegam0/a**3
+                radiation = Omegar0/a**4
+                E = np.sqrt(constant+matter+radiation)
+                return H0*(E-sqrt_Omegarc), -H0*(3*matter+4*radiation)/(2*a*E)
+        elif model_H == 'kmoufl':
+            H_dH = get_kmoufl_background().at(par1, par2)
+        else:
+            raise Exception("Incorrect model specified.")
+
+        # mu(a, H, dH, x) with H and dH already known
+        if model == 'LCDM':
+            def mu(a, H, dH, x=None):
+                return 1
+        elif model == 'E11':
+            def mu(a, H, dH, x=None):
+                return 1 + par1*(1-H0**2*(Omegam0/a**3+Omegar0/a**4)/H**2)
+        elif model == 'gmu':
+            def mu(a, H, dH, x=None):
+                return 1 + par1*(1-a) - par1*(1-a)**2
+        elif model == 'DES':
+            def mu(a, H, dH, x=None):
+                OmegaL = 1-H0**2*(Omegam0/a**3+Omegar0/a**4)/H**2
+                return 1 + par1*OmegaL + par2*OmegaL**2
+        elif model == 'wCDM':
+            wL = par1
+            gamma = par2
+
+            def mu(a, H, dH, x=None):
+                OmegaM = H0**2*Omegam0/(a**3*H**2)
+                OmegaL = 1-OmegaM-H0**2*Omegar0/(a**4*H**2)
+                return 2/3*OmegaM**(gamma-1)*(OmegaM**gamma+2-3*gamma+3*(gamma-1/2)*(OmegaM+(1+wL)*OmegaL))
+        elif model == 'nDGP':
+            rc = par1/c
+
+            def mu(a, H, dH, x=None):
+                beta = 1 + 2*H*rc*(1+a*dH/(3*H))
+                if x is None:
+                    return 1 + 1/(3*beta)
+                x3 = x**(-3)
+                return 1 + 2/(3*beta)*(np.sqrt(1+x3)-1)/x3
+        elif model == 'kmoufl':
+            def mu(a, H, dH, x=None):
+                X_kmfl = 0.5*(1.0+par1*a)**2*(H*a)**2/(OmegaL0*H0**2)
+                return 1. + 2.0*par1**2/(1.0 + 2.0*par2*X_kmfl)
+        else:
+            raise Exception("Incorrect model specified.")
+
+        self.H_dH = H_dH
+        self.mu = mu
+
+    """
+    Calculate H, dH/da and mu together.
+
+    Parameters:
+        a (float or array): The scale factor(s).
+        x (float or array, optional): R/R_V for the non-linear nDGP mu; the
+            linear mu is returned if it is not given.
+
+    Returns:
+        tuple: (H, dH/da, mu) at a.
+    """
+
+    def H_dH_mu(self, a, x=None):
+        H, dH = self.H_dH(a)
+        return H, dH, self.mu(a, H, dH, x)
+
+
+"""
+Get the background kernel of a cosmology, building it on first use.
+
+Parameters:
+    model (str): The model of MG for mu.
+    model_H (str): The model of MG for H(a).
+    par1 (float): The first MG parameter.
+    par2 (float): The second MG parameter.
+
+Returns:
+    background_kernel: The cached kernel.
+"""
+
+
+def kernel(model, model_H, par1, par2):
+    key = (model, model_H, par1, par2)
+    background = kernel_cache.get(key)
+    if background is None:
+        background = background_kernel(model, model_H, par1, par2)
+        kernel_cache.set(key, background)
+    return background
 
 
 class cosmological_functions:
@@ -44,9 +210,7 @@ class cosmological_functions:
             OmegaLambda0 = 1 - Omegam0 - Omegar0 + 2*np.sqrt(Omegarc)
             return H0*np.sqrt(Omegam0*a**(-3)+Omegar0*a**(-4)+Omegarc + OmegaLambda0)-H0*np.sqrt(Omegarc)
         elif model_H == 'kmoufl':
-            closest_beta = (np.absolute(beta_arr-par1)).argmin()
-            closest_K0 = (np.absolute(K0_arr-par2)).argmin()
-            return kmoufl_H[closest_K0, closest_beta](a)
+            return get_kmoufl_background().H_dH(a, par1, par2)[0]
         else:
             raise Exception("Incorrect model specified.")
 
@@ -80,9 +244,7 @@ class cosmological_functions:
             OmegaLambda0 = 1 - Omegam0 - Omegar0 + 2*np.sqrt(Omegarc)
             return (H0*((-3*Omegam0)/a**4 - (4*Omegar0)/a**5))/(2.*np.sqrt(OmegaLambda0 + Omegam0/a**3 + Omegar0/a**4 + Omegarc))
         elif model_H == 'kmoufl':
-            closest_beta = (np.absolute(beta_arr-par1)).argmin()
-            closest_K0 = (np.absolute(K0_arr-par2)).argmin()
-            return kmoufl_dH[closest_K0, closest_beta](a)
+            return get_kmoufl_background().H_dH(a, par1, par2)[1]
         else:
             raise Exception("Incorrect model specified.")
 
@@ -97,6 +259,8 @@ class cosmological_functions:
         par2 (float): The second parameter for the model.
         type (str, optional): The type of model (only used for nDGP model).
         x (float, optional): The value of x (only used for nonlinear nDGP model).
+        H (float, optional): H(a), if already known.
+        dH (float, optional): dH/da, if already known.
 
     Returns:
         float: The calculated value of mu.
@@ -105,9 +269,10 @@ class cosmological_functions:
         Exception: If an incorrect model is specified.
     """
 
-    def mu(self, a, model, model_H, par1, par2, type=None, x=None):
-        H = self.H_f(a, model_H, par1, par2)
-        dHda = self.dH_f(a, model_H, par1, par2)
+    def mu(self, a, model, model_H, par1, par2, type=None, x=None, H=None, dH=None):
+        if H is None:
+            H = self.H_f(a, model_H, par1, par2)
+        dHda = dH if dH is not None else self.dH_f(a, model_H, par1, par2)
         dHdt = a*H*dHda
         rhom = 3*H0**2*Omegam0*a**(-3)
         rhor = 3*H0**2*Omegar0*a**(-4)
@@ -146,3 +311,128 @@ class cosmological_functions:
             return 1. + epsl1_kmfl
         else:
             raise Exception("Incorrect model specified.")
+
+    """
+    Calculate the background coefficients of the linear growth equation.
+
+    The equation reads delta'' = -F(a) delta' + G(a) delta, with the friction
+    F = 3/a + dH/H and the source G = 3 Omegam0 mu/(2 a^5 H^2/H0^2). The
+    columns are scaled by powers of a to make them smooth in ln(a).
+
+    Parameters:
+        a (array): The scale factors.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        list: [a F, a^2 G] evaluated at a.
+    """
+
+    def growth_coefficients(self, a, model, model_H, par1, par2):
+        H, dH, mu = kernel(model, model_H, par1, par2).H_dH_mu(a)
+        friction = 3/a+dH/H
+        source = (3*Omegam0)/(2*a**5*H**2/H0**2)
+        if model_H == 'LCDM' or model_H == 'wCDM' or model_H == 'nDGP':
+            columns = [a*friction, a**2*source*mu]
+        elif model_H == 'kmoufl':
+            A_kmfl = 1.0 + par1*a
+            X_kmfl = 0.5 * A_kmfl**2*(H*a)**2/((1-Omegam0-Omegar0)*H0**2)
+            k_prime_mfl = 1.0 + 2.0*par2*X_kmfl
+            epsl1_kmfl = 2.0*par1**2/k_prime_mfl
+            epsl2_kmfl = a*par1/(1.0+par1*a)
+            columns = [a*friction + epsl2_kmfl, a**2*source*(1+epsl1_kmfl)]
+        else:
+            raise Exception("Incorrect model specified.")
+        return [column*np.ones_like(a) for column in columns]
+
+    """
+    Build the right-hand side of the linear growth equation.
+
+    The background is tabulated once on a grid in ln(a); the state holds n
+    independent perturbations as y = [delta_1..delta_n, ddelta_1..ddelta_n].
+
+    Parameters:
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        callable: f(a, y) returning dy/da with the shape of y.
+    """
+
+    def growth_rhs(self, model, model_H, par1, par2):
+        a = np.geomspace(ai/2, 2.5, 4000)
+        coefficients = uniform_spline(np.log(a), self.growth_coefficients(
+            a, model, model_H, par1, par2))
+
+        def rhs(a, y):
+            n = len(y)//2
+            delta, ddeltada = y[:n], y[n:]
+            aF, a2G = coefficients(math.log(a))
+            return np.concatenate((ddeltada, -aF/a*ddeltada + a2G/a**2*delta))
+        return rhs
+
+    """
+    Integrate the linear growth D(a) once per cosmology.
+
+    The growth equation is solved from ai to a = 2 with D(ai) = 1 and
+    dD/da(ai) = 1/ai (growing mode in matter domination) using adaptive steps
+    and dense output. The solution is memoized per (model, model_H, par1, par2).
+
+    Parameters:
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        scipy.integrate.OdeSolution: Dense solution for [D, dD/da].
+    """
+
+    def growth_solution(self, model, model_H, par1, par2):
+        key = (model, model_H, par1, par2)
+        solution = growth_cache.get(key)
+        if solution is None:
+            solution = scipy.integrate.solve_ivp(self.growth_rhs(model, model_H, par1, par2), (ai, 1/(1-0.5)), [1.0, 1/ai],
+                                                 method='DOP853', rtol=1e-10, atol=1e-12, dense_output=True).sol
+            growth_cache.set(key, solution)
+        return solution
+
+    """
+    Calculate the linear growth factor normalized to D(a = 1) = 1.
+
+    Parameters:
+        a (float or array): The scale factor(s), ai <= a <= 2.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        float or numpy.ndarray: D(a)/D(1).
+    """
+
+    def growth(self, a, model, model_H, par1, par2):
+        solution = self.growth_solution(model, model_H, par1, par2)
+        return solution(a)[0]/solution(1)[0]
+
+    """
+    Calculate the linear growth rate f = dln(D)/dln(a).
+
+    Parameters:
+        a (float or array): The scale factor(s), ai <= a <= 2.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        float or numpy.ndarray: The growth rate at a.
+    """
+
+    def growth_rate(self, a, model, model_H, par1, par2):
+        D, dDda = self.growth_solution(model, model_H, par1, par2)(a)
+        return a*dDda/D
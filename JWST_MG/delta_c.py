@@ -1,5 +1,67 @@
 from JWST_MG.constants import *
-from JWST_MG.cosmological_functions import cosmological_functions
+from JWST_MG.cosmological_functions import cosmological_functions, kernel, uniform_spline
+from JWST_MG.cache import LRU_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# delta_c(a_c) values keyed by (ac, model, model_H, par1, par2)
+deltac_cache = LRU_cache(maxsize=4096)
+# Collapse scale factors of shooting probes keyed by (deltai, model, model_H, par1, par2)
+collapse_cache = LRU_cache(maxsize=4096)
+# Precompiled ODE right-hand sides keyed by (type, model, model_H, par1, par2)
+rhs_cache = LRU_cache(maxsize=64)
+
+# Precomputed delta_c tables (see tables/delta_c_tables.py); bump the version
+# whenever the spherical collapse solver or its settings change
+deltac_table_version = 3
+deltac_table_path = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'deltac_tables')
+deltac_tables = {}
+# (model, model_H) pairs for which falling back to the direct solve was logged
+deltac_fallback_logged = set()
+
+
+"""
+Load the interpolator of the precomputed delta_c table for a pair of models.
+
+Tables are stored as deltac_tables/delta_c_<model>_<model_H>.npz with the
+axes ac, par1, par2, the flags log_axes (interpolate in the log of an axis)
+and deltac of shape (len(ac), len(par1), len(par2)). An axis with a single
+node marks a parameter that delta_c does not depend on for this model.
+
+Parameters:
+    model (str): The model of MG for mu.
+    model_H (str): The model of MG for H(a).
+
+Returns:
+    tuple or None: The interpolator and the description of its axes, or None
+    if no table with the current version exists.
+"""
+
+
+def load_deltac_table(model, model_H):
+    key = (model, model_H)
+    if key not in deltac_tables:
+        filename = os.path.join(
+            deltac_table_path, 'delta_c_%s_%s.npz' % (model, model_H))
+        deltac_tables[key] = None
+        try:
+            with np.load(filename) as data:
+                if int(data['version']) == deltac_table_version and float(data['ai']) == ai:
+                    axes = [data['ac'], data['par1'], data['par2']]
+                    log_axes = data['log_axes']
+                    values = data['deltac']
+                    active = [i for i in range(3) if len(axes[i]) > 1]
+                    points = [np.log(axes[i]) if log_axes[i] else axes[i]
+                              for i in active]
+                    interpolator = scipy.interpolate.RegularGridInterpolator(
+                        points, values.reshape([len(axes[i]) for i in active]),
+                        bounds_error=False, fill_value=np.nan)
+                    deltac_tables[key] = (interpolator, active, log_axes)
+        except (OSError, KeyError, ValueError):
+            pass
+    return deltac_tables[key]
 
 
 class delta_c:
@@ -36,12 +98,10 @@ class delta_c:
 
     def delta_nl_ODE(self, a, y, model, model_H, par1, par2):
         delta, ddeltada = y
-        cosmological_library = cosmological_functions(
-            a, model, model_H, par1, par2)
-        H = cosmological_library.H_f(a, model_H, par1, par2)
-        dH = cosmological_library.dH_f(a, model_H, par1, par2)
+        background = kernel(model, model_H, par1, par2)
+        H, dH = background.H_dH(a)
         if model_H == 'LCDM' or model_H == 'wCDM':
-            mu = cosmological_library.mu(a, model, model_H, par1, par2)
+            mu = background.mu(a, H, dH)
             dddeltada = -(3/a+dH/H)*ddeltada + (3*Omegam0*mu)/(2*a**5*H **
                                                                2/H0**2)*delta*(1+delta) + 4*ddeltada**2/(3*(1+delta))
         elif model_H == 'nDGP':
@@ -49,8 +109,7 @@ class delta_c:
             beta = 1 + 2*H*par1/c*(1+Hdot/(3*H**2))
             epsilon = 8/(9*beta**2)*(H0*par1/c)**2*Omegam0*a**(-3)
             RRV = (epsilon*delta)**(-1/3)
-            mu = cosmological_library.mu(
-                a, model, model_H, par1, par2, type='nonlinear', x=RRV)
+            mu = background.mu(a, H, dH, x=RRV)
             dddeltada = -(3/a+dH/H)*ddeltada + (3*Omegam0*mu)/(2*a**5*H **
                                                                2/H0**2)*delta*(1+delta) + 4*ddeltada**2/(3*(1+delta))
         elif model == 'kmoufl':
@@ -82,17 +141,14 @@ class delta_c:
     """
     def delta_l_ODE(self, a, y, model, model_H, par1, par2):
         delta, ddeltada = y
-        cosmological_library = cosmological_functions(
-            a, model, model_H, par1, par2)
-        H = cosmological_library.H_f(a, model_H, par1, par2)
-        dH = cosmological_library.dH_f(a, model_H, par1, par2)
+        background = kernel(model, model_H, par1, par2)
+        H, dH = background.H_dH(a)
         if model_H == 'LCDM' or model_H == 'wCDM':
-            mu = cosmological_library.mu(a, model, model_H, par1, par2)
+            mu = background.mu(a, H, dH)
             dddeltada = -(3/a+dH/H)*ddeltada + (3*Omegam0*mu) / \
                 (2*a**5*H**2/H0**2)*delta
         elif model_H == 'nDGP':
-            mu = cosmological_library.mu(
-                a, model, model_H, par1, par2, type='linear')
+            mu = background.mu(a, H, dH)
             dddeltada = -(3/a+dH/H)*ddeltada + (3*Omegam0*mu) / \
                 (2*a**5*H ** 2/H0**2)*delta
         elif model_H == 'kmoufl':
@@ -107,44 +163,344 @@ class delta_c:
             raise Exception("Incorrect model specified")
         return [ddeltada, dddeltada]
 
+    """
+    Tabulate the background coefficients of the non-linear ODE on a grid in ln(a).
+
+    H(a) and dH/da enter the ODE only through the friction term F(a) and the
+    source term G(a) (together with the nDGP screening factors), so these are
+    evaluated once and splined. The columns are scaled by powers of a to make
+    them smooth in ln(a).
+
+    Parameters:
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        callable: Cubic spline in ln(a), evaluated at a scalar ln(a), returning
+        [a F, a^2 G] or, for nDGP, [a F, a^2 G, 2/(3 beta), a^3 epsilon].
+    """
+
+    def rhs_coefficients(self, model, model_H, par1, par2):
+        a = np.geomspace(ai/2, 2.5, 4000)
+        background = kernel(model, model_H, par1, par2)
+        H, dH = background.H_dH(a)
+        friction = 3/a+dH/H
+        source = (3*Omegam0)/(2*a**5*H**2/H0**2)
+        if model_H == 'nDGP' and model == 'nDGP':
+            Hdot = a*H*dH
+            beta = 1 + 2*H*par1/c*(1+Hdot/(3*H**2))
+            epsilon = 8/(9*beta**2)*(H0*par1/c)**2*Omegam0*a**(-3)
+            columns = [a*friction, a**2*source, 2/(3*beta), a**3*epsilon]
+        elif model_H == 'LCDM' or model_H == 'wCDM' or model_H == 'nDGP':
+            mu = background.mu(a, H, dH)
+            columns = [a*friction, a**2*source*mu]
+        elif model == 'kmoufl':
+            A_kmfl = 1.0 + par1*a
+            X_kmfl = 0.5 * A_kmfl**2*(H*a)**2/((1-Omegam0-Omegar0)*H0**2)
+            k_prime_mfl = 1.0 + 2.0*par2*X_kmfl
+            epsl1_kmfl = 2.0*par1**2/k_prime_mfl
+            epsl2_kmfl = a*par1/(1.0+par1*a)
+            columns = [a*friction + epsl2_kmfl, a**2*source*(1+epsl1_kmfl)]
+        else:
+            raise Exception("Incorrect model specified")
+        return uniform_spline(np.log(a), [column*np.ones_like(a) for column in columns])
+
+    """
+    Build the right-hand side of the non-linear ODE for one cosmology.
+
+    The model branches are resolved and the background is tabulated once; the
+    returned closure only evaluates one spline per call. The state holds n
+    independent perturbations as y = [delta_1..delta_n, ddelta_1..ddelta_n].
+
+    Parameters:
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        callable: f(a, y) returning dy/da with the shape of y.
+    """
+
+    def nonlinear_rhs(self, model, model_H, par1, par2):
+        key = ('nonlinear', model, model_H, par1, par2)
+        rhs = rhs_cache.get(key)
+        if rhs is not None:
+            return rhs
+        coefficients = self.rhs_coefficients(model, model_H, par1, par2)
+
+        if model_H == 'nDGP' and model == 'nDGP':
+            def rhs(a, y):
+                n = len(y)//2
+                delta, ddeltada = y[:n], y[n:]
+                aF, a2G, beta_factor, a3epsilon = coefficients(math.log(a))
+                # mu with RRV^(-3) = epsilon*delta; 1+x3 is clamped at 0
+                # for the trial steps of the solver that reach delta < -1
+                x3 = a3epsilon/a**3*delta
+                mu = 1 + beta_factor*(np.sqrt(np.maximum(1+x3, 0))-1)/x3
+                dddeltada = -aF/a*ddeltada + a2G/a**2*mu * \
+                    delta*(1+delta) + 4*ddeltada**2/(3*(1+delta))
+                return np.concatenate((ddeltada, dddeltada))
+        else:
+            def rhs(a, y):
+                n = len(y)//2
+                delta, ddeltada = y[:n], y[n:]
+                aF, a2G = coefficients(math.log(a))
+                dddeltada = -aF/a*ddeltada + a2G/a**2 * \
+                    delta*(1+delta) + 4*ddeltada**2/(3*(1+delta))
+                return np.concatenate((ddeltada, dddeltada))
+
+        rhs_cache.set(key, rhs)
+        return rhs
+
+    """
+    Build the right-hand side of the linear ODE for one cosmology.
+
+    Same conventions as nonlinear_rhs; the equation itself is the growth
+    equation of cosmological_functions.growth_rhs.
+
+    Parameters:
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        callable: f(a, y) returning dy/da with the shape of y.
+    """
+
+    def linear_rhs(self, model, model_H, par1, par2):
+        key = ('linear', model, model_H, par1, par2)
+        rhs = rhs_cache.get(key)
+        if rhs is None:
+            rhs = cosmological_functions(
+                ai, model, model_H, par1, par2).growth_rhs(model, model_H, par1, par2)
+            rhs_cache.set(key, rhs)
+        return rhs
+
     """
     Spherical collapse system given the initial deltai, model, model_H, par1, and par2.
-    
+
+    The non-linear ODE is integrated with adaptive steps up to a = 2 and stopped
+    by a terminal event once delta exceeds 1e7.
+
     Args:
         deltai (float): The initial delta value.
         model (object): The model object.
         model_H (object): The model_H object.
         par1 (float): The par1 value.
         par2 (float): The par2 value.
-    
+        dense_output (bool, optional): Also return the continuous solution.
+
     Returns:
-        float: The value of scale factor at which spherical collapse occurs.
+        float: The value of scale factor at which spherical collapse occurs
+        (a = 2 if it does not collapse before). With dense_output, a tuple of
+        this value and a callable returning [delta, ddelta/da] at any a.
+        See collapse_history for the sampled [a, delta] array.
     """
 
-    def collapse(self, deltai, model, model_H, par1, par2):
-        dt = 0.00002
+    def collapse(self, deltai, model, model_H, par1, par2, dense_output=False):
         ddeltai = deltai/ai
         init = [deltai, ddeltai]
-        system = ode(self.delta_nl_ODE)
-        system.set_f_params(*[model, model_H, par1, par2])
-        system.set_initial_value(init, ai)
-
-        data = []
-        if model_H != 'kmoufl':
-            while system.successful() and system.y[0] <= 1e7 and system.t <= 1/(1-0.5):
-                data.append(
-                    [system.t + dt, system.integrate(system.t + dt)[0]])
-            # plt.scatter(system.t+dt, system.integrate(system.t + dt)[0], c ='tab:blue')
+
+        def diverged(a, y):
+            return y[0] - 1e7
+        diverged.terminal = True
+        diverged.direction = 1
+
+        solution = scipy.integrate.solve_ivp(self.nonlinear_rhs(model, model_H, par1, par2), (ai, 1/(1-0.5)), init,
+                                             method='DOP853', rtol=1e-8, atol=1e-8*deltai,
+                                             events=diverged, dense_output=dense_output)
+        if len(solution.t_events[0]) > 0:
+            ac = solution.t_events[0][0]
         else:
-            while system.successful() and system.y[0] <= 1e7 and system.t <= 1/(1-0.5):
-                data.append(
-                    [system.t + dt, system.integrate(system.t + dt)[0]])
+            ac = solution.t[-1]
+
+        if dense_output:
+            return ac, solution.sol
+        return ac
+
+    """
+    Integrate a spherical collapse and return the history of the overdensity.
+
+    This is the array the former collapse returned; it is sampled from the
+    continuous solution of collapse(dense_output=True).
+
+    Parameters:
+        deltai (float): The initial overdensity at a = ai.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+        dt (float, optional): Spacing of the samples in a.
+
+    Returns:
+        numpy.ndarray: Rows [a, delta] every dt from ai up to the collapse
+        (or a = 2), ending at the collapse scale factor itself.
+    """
 
-        data = np.array(data)
-        return data
+    def collapse_history(self, deltai, model, model_H, par1, par2, dt=0.00002):
+        ac, solution = self.collapse(
+            deltai, model, model_H, par1, par2, dense_output=True)
+        a = np.append(np.arange(ai+dt, ac, dt), ac)
+        return np.column_stack((a, solution(a)[0]))
 
     """
-    Perform a binary search to find the index of the element in delta_ini that is closest to the given ac value within a specified absolute error. 
+    Integrate many spherical collapses at once and return their collapse scale factors.
+
+    All initial overdensities are evolved as one vectorized ODE system. Larger
+    deltai collapse earlier, so the system is ordered by decreasing deltai and
+    a terminal event on the leading perturbation removes it from the system
+    once it exceeds 1e7; integration then continues with the remaining ones.
+
+    Args:
+        deltai_arr (array): Initial overdensities at a = ai.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        numpy.ndarray: Collapse scale factor for each deltai (a = 2 if it does
+        not collapse before).
+    """
+
+    def collapse_many(self, deltai_arr, model, model_H, par1, par2):
+        deltai_arr = np.asarray(deltai_arr, dtype=np.float64)
+        order = np.argsort(deltai_arr)[::-1]
+        rhs = self.nonlinear_rhs(model, model_H, par1, par2)
+
+        def diverged(a, y):
+            return y[0] - 1e7
+        diverged.terminal = True
+        diverged.direction = 1
+
+        ac_arr = np.full(len(deltai_arr), 1/(1-0.5))
+        a_start = ai
+        y = np.concatenate((deltai_arr[order], deltai_arr[order]/ai))
+        atol = 1e-8*deltai_arr.min()
+        for n_done in range(len(order)):
+            solution = scipy.integrate.solve_ivp(rhs, (a_start, 1/(1-0.5)), y, method='DOP853',
+                                                 rtol=1e-8, atol=atol, events=diverged)
+            if len(solution.t_events[0]) == 0:
+                break
+            # Drop the collapsed leading perturbation and carry on with the rest
+            a_start = solution.t_events[0][0]
+            ac_arr[order[n_done]] = a_start
+            y_event = solution.y_events[0][0]
+            n = len(y_event)//2
+            y = np.concatenate((y_event[1:n], y_event[n+1:]))
+        return ac_arr
+
+    """
+    Calculate delta_c on a whole array of collapse scale factors.
+
+    A coarse and a fine batch of collapse integrations (see collapse_many)
+    give a_c(deltai); the initial overdensity for each ac is interpolated
+    from it in log-log space instead of running one shooting per ac. Only
+    ac later than every collapse of the fine batch are solved by shooting.
+
+    Args:
+        ac_arr (array): Scale factors of collapse.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+        n_deltai (int, optional): Number of initial overdensities in the fine batch.
+
+    Returns:
+        numpy.ndarray: delta_c at each ac.
+    """
+
+    def delta_c_curve(self, ac_arr, model, model_H, par1, par2, n_deltai=64):
+        ac_arr = np.asarray(ac_arr, dtype=np.float64)
+
+        # Coarse pass over delta_ini to bracket the requested range of ac
+        deltai_coarse = np.geomspace(delta_ini[0], delta_ini[-1], 16)
+        ac_coarse = self.collapse_many(
+            deltai_coarse, model, model_H, par1, par2)
+        low = np.searchsorted(-ac_coarse, -ac_arr.max(), side='right')-1
+        high = np.searchsorted(-ac_coarse, -ac_arr.min(), side='left')
+        if low < 0 or high >= len(deltai_coarse):
+            raise Exception(
+                "Collapse at ac in [%s, %s] is not bracketed by delta_ini." % (ac_arr.min(), ac_arr.max()))
+
+        deltai_fine = np.geomspace(
+            deltai_coarse[low], deltai_coarse[high], n_deltai)
+        ac_fine = self.collapse_many(deltai_fine, model, model_H, par1, par2)
+        collapsed = ac_fine < 1/(1-0.5)
+        lndeltai = scipy.interpolate.CubicSpline(
+            np.log(ac_fine[collapsed])[::-1], np.log(deltai_fine[collapsed])[::-1])
+        deltai = np.exp(lndeltai(np.log(ac_arr)))
+        # Past the latest collapse of the fine batch the spline would
+        # extrapolate; ac can jump to a = 2 below a threshold deltai there
+        for i in np.flatnonzero(ac_arr > ac_fine[collapsed].max()):
+            deltai[i] = self.shooting_di(
+                ac_arr[i], model, model_H, par1, par2)
+
+        # Not stored in deltac_cache, which only holds table and shooting
+        # values for delta_c_at_ac
+        return self.linear_delta(deltai, ac_arr, model, model_H, par1, par2)
+
+    """
+    Find the initial overdensity at a = ai that collapses exactly at ac.
+
+    The shooting problem is solved with Brent's method on log(deltai) within
+    the bracket [delta_ini[0], delta_ini[-1]]. Collapse scale factors of all
+    probes are kept in collapse_cache, so the bracket ends and repeated probes
+    are integrated only once per cosmology.
+
+    Args:
+        ac (float): The scale factor of collapse.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+        rtol (float, optional): Relative tolerance on deltai (and thus on ac).
+        full_output (bool, optional): Also return the solver statistics.
+
+    Returns:
+        float: The initial overdensity. With full_output, a tuple of it and a
+        dict with the number of iterations and of collapse integrations.
+
+    Raises:
+        Exception: If ac is not bracketed by the range of delta_ini.
+    """
+
+    def shooting_di(self, ac, model, model_H, par1, par2, rtol=abs_err, full_output=False):
+        n_collapse = [0]
+
+        def residual(lndeltai):
+            key = (lndeltai, model, model_H, par1, par2)
+            ac_predict = collapse_cache.get(key)
+            if ac_predict is None:
+                ac_predict = self.collapse(
+                    np.exp(lndeltai), model, model_H, par1, par2)
+                collapse_cache.set(key, ac_predict)
+                n_collapse[0] += 1
+            return np.log(ac_predict/ac)
+
+        low = np.log(delta_ini[0])
+        high = np.log(delta_ini[-1])
+        if residual(low)*residual(high) > 0:
+            raise Exception(
+                "Collapse at ac = %s is not bracketed by delta_ini." % ac)
+        lndeltai, info = scipy.optimize.brentq(
+            residual, low, high, xtol=rtol, full_output=True)
+
+        if full_output:
+            return np.exp(lndeltai), {'iterations': info.iterations,
+                                      'collapse_solves': n_collapse[0],
+                                      'converged': info.converged}
+        return np.exp(lndeltai)
+
+    """
+    Find the initial overdensity that collapses at ac.
+
+    Kept for backward compatibility: delegates to shooting_di, so low and high
+    are ignored and abs_err is used as the relative tolerance.
 
     Args:
         ac (float): The target value for the search.
@@ -152,29 +508,16 @@ class delta_c:
         model_H (object): The model object used for prediction.
         par1 (float): The parameter for the collapse function.
         par2 (float): The parameter for the collapse function.
-        low (int): The lower bound of the search range.
-        high (int): The upper bound of the search range.
-        abs_err (float): The acceptable absolute error for the search.
+        low (int): Unused.
+        high (int): Unused.
+        abs_err (float): The acceptable relative error for the search.
 
     Returns:
-        int: The index of the element in delta_ini that is closest to the given ac value within the specified absolute error.
+        float: The initial overdensity collapsing at ac.
     """
 
     def binary_search_di(self, ac, model, model_H, par1, par2, low, high, abs_err):
-        mid = (low + high)//2
-        ac_predict = self.collapse(
-            delta_ini[mid], model, model_H, par1, par2)[-1, 0]
-        if high >= low:
-            if abs(ac_predict-ac)/ac_predict <= abs_err:
-                return delta_ini[mid]
-            elif ac_predict < ac:
-                return self.binary_search_di(ac, model, model_H, par1, par2, low, mid - 1, abs_err)
-            else:
-                return self.binary_search_di(ac, model, model_H, par1, par2, mid + 1, high, abs_err)
-        else:
-            low = 0
-            high = len(delta_ini) - 1
-            return self.binary_search_di(ac, model, model_H, par1, par2, low, high, abs_err*2)
+        return self.shooting_di(ac, model, model_H, par1, par2, rtol=abs_err)
 
     """
     Generate the data points for the linear delta based on the given parameters.
@@ -186,35 +529,42 @@ class delta_c:
         model_H (object): The H model object.
         par1 (float): Parameter 1.
         par2 (float): Parameter 2.
+        n_points (int, optional): Number of points between ai and a.
 
     Returns:
-        numpy.ndarray: An array containing the data points.
+        numpy.ndarray: An array containing the data points [a, delta].
     """
 
-    def linear(self, deltai_collapse, a, model, model_H, par1, par2):
-        dt = 0.00001
-        ddeltai = deltai_collapse/ai
-        init = [deltai_collapse, ddeltai]
-        system = ode(self.delta_l_ODE)
-        system.set_f_params(*[model, model_H, par1, par2])
-        system.set_initial_value(init, ai)
+    def linear(self, deltai_collapse, a, model, model_H, par1, par2, n_points=1000):
+        a_arr = np.linspace(ai, a, n_points)
+        return np.column_stack((a_arr, self.linear_delta(deltai_collapse, a_arr, model, model_H, par1, par2)))
 
-        data = []
-        while system.successful() and system.t <= a:
-            data.append([system.t + dt, system.integrate(system.t + dt)[0]])
-            # plt.scatter(system.t+dt, system.integrate(system.t + dt)[0], c ='tab:orange')
+    """
+    Evolve an initial overdensity with linear theory.
 
-        data = np.array(data)
-        return data
+    Parameters:
+        deltai_collapse (float): The initial overdensity at a = ai.
+        a (float or array): Scale factors to evaluate the linear overdensity at.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
 
-    def delta_nl_ODE2(self, y, a, model, model_H, par1, par2):
-        delta, ddeltada = y
+    Returns:
+        float or numpy.ndarray: Linear overdensity at a.
+    """
+
+    def linear_delta(self, deltai_collapse, a, model, model_H, par1, par2):
         cosmological_library = cosmological_functions(
             a, model, model_H, par1, par2)
-        H = cosmological_library.H_f(a, model_H, par1, par2)
-        dH = cosmological_library.dH_f(a, model_H, par1, par2)
+        return deltai_collapse*cosmological_library.growth(a, model, model_H, par1, par2)/cosmological_library.growth(ai, model, model_H, par1, par2)
+
+    def delta_nl_ODE2(self, y, a, model, model_H, par1, par2):
+        delta, ddeltada = y
+        background = kernel(model, model_H, par1, par2)
+        H, dH = background.H_dH(a)
         if model_H == 'LCDM' or model_H == 'wCDM':
-            mu = cosmological_library.mu(a, model, model_H, par1, par2)
+            mu = background.mu(a, H, dH)
             dddeltada = -(3/a+dH/H)*ddeltada + (3*Omegam0*mu)/(2*a**5*H **
                                                            2/H0**2)*delta*(1+delta) + 4*ddeltada**2/(3*(1+delta))
         elif model_H == 'nDGP':
@@ -222,8 +572,7 @@ class delta_c:
             beta = 1 + 2*H*par1/c*(1+Hdot/(3*H**2))
             epsilon = 8/(9*beta**2)*(H0*par1/c)**2*Omegam0*a**(-3)
             RRV = (epsilon*delta)**(-1/3)
-            mu = cosmological_library.mu(
-                a, model, model_H, par1, par2, type='nonlinear', x=RRV)
+            mu = background.mu(a, H, dH, x=RRV)
             dddeltada = -(3/a+dH/H)*ddeltada + (3*Omegam0*mu)/(2*a**5*H **
                                                                2/H0**2)*delta*(1+delta) + 4*ddeltada**2/(3*(1+delta))
         elif model == 'kmoufl':
@@ -260,10 +609,74 @@ class delta_c:
         ddeltai = deltai_collapse/ai
         init = [deltai_collapse, ddeltai]
 
-        delta_arr = scipy.integrate.odeint(self.delta_nl_ODE2, init, a, args=(
-            model, model_H, par1, par2), tfirst=False)
+        delta_arr = scipy.integrate.odeint(self.nonlinear_rhs(
+            model, model_H, par1, par2), init, a, tfirst=True)
 
         return delta_arr[:, 0]
 
-    def delta_c_at_ac(self, ac, model, model_H, par1, par2):
-        return self.linear(self.binary_search_di(ac, model, model_H, par1, par2, 0, len(delta_ini)-1, abs_err), ac, model, model_H, par1, par2)[-1, 1]
+    """
+    Interpolate delta_c from the precomputed table.
+
+    Parameters:
+        ac (float): The scale factor of collapse.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+
+    Returns:
+        float or None: The interpolated delta_c, or None if there is no table
+        for the models or the point lies outside of it.
+    """
+
+    def delta_c_table(self, ac, model, model_H, par1, par2):
+        table = load_deltac_table(model, model_H)
+        if table is None:
+            return None
+        interpolator, active, log_axes = table
+        point = [ac, par1, par2]
+        point = [np.log(point[i]) if log_axes[i] else point[i]
+                 for i in active]
+        deltac = interpolator(point)[0]
+        if np.isnan(deltac):
+            return None
+        return deltac
+
+    """
+    Calculate the critical linear overdensity for spherical collapse at ac.
+
+    Parameters:
+        ac (float): The scale factor of collapse.
+        model (str): The model of MG for mu.
+        model_H (str): The model of MG for H(a).
+        par1 (float): The first MG parameter.
+        par2 (float): The second MG parameter.
+        use_table (bool, optional): Interpolate the precomputed table when the
+            point is covered by it, otherwise solve for spherical collapse.
+
+    Returns:
+        float: delta_c at ac.
+    """
+
+    def delta_c_at_ac(self, ac, model, model_H, par1, par2, use_table=True):
+        key = (ac, model, model_H, par1, par2)
+        deltac = None
+        if use_table:
+            deltac = deltac_cache.get(key)
+            if deltac is None:
+                deltac = self.delta_c_table(ac, model, model_H, par1, par2)
+        if deltac is None:
+            if use_table and (model, model_H) not in deltac_fallback_logged:
+                deltac_fallback_logged.add((model, model_H))
+                if load_deltac_table(model, model_H) is None:
+                    logger.warning("No delta_c table (version %d) for %s/%s in %s; solving for "
+                                   "spherical collapse directly. Generate it with tables/delta_c_tables.py.",
+                                   deltac_table_version, model, model_H, deltac_table_path)
+                else:
+                    logger.warning("ac = %s, par1 = %s, par2 = %s is outside the delta_c table for %s/%s; "
+                                   "solving for spherical collapse directly (logged once per model).",
+                                   ac, par1, par2, model, model_H)
+            deltac = self.linear_delta(self.shooting_di(
+                ac, model, model_H, par1, par2), ac, model, model_H, par1, par2)
+        deltac_cache.set(key, deltac)
+        return deltac
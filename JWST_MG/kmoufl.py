@@ -0,0 +1,243 @@
+import argparse
+import logging
+import tempfile
+from JWST_MG.constants import *
+from JWST_MG.cache import LRU_cache
+
+logger = logging.getLogger(__name__)
+
+# Numeric kmoufl tables (see tables/kmoufl_tables.py); bump the version
+# whenever the layout of the files changes
+kmoufl_table_version = 2
+kmoufl_table_path = os.path.dirname(os.path.realpath(__file__))
+
+
+"""
+Locate the interpolation cells of x on a sorted grid.
+
+Parameters:
+    grid (array): Sorted grid nodes.
+    x (array): Points to locate.
+    extrapolate (bool, optional): Use the end cells linearly beyond the grid,
+        otherwise x is clipped to the grid.
+
+Returns:
+    tuple: Left node indices and the linear weights of the right nodes.
+"""
+
+
+def grid_cells(grid, x, extrapolate=False):
+    if not extrapolate:
+        x = np.clip(x, grid[0], grid[-1])
+    i = np.clip(np.searchsorted(grid, x, side='right')-1, 0, len(grid)-2)
+    return i, (x-grid[i])/(grid[i+1]-grid[i])
+
+
+class kmoufl_background:
+    ########################################################################
+    # Initialize a class kmoufl_background (H(a) of k-mouflage tabulated on a
+    # regular (K0, beta, a) grid)
+    # array K0 - grid of K0 values (par2)
+    # array beta - grid of beta values (par1)
+    # array a - scale factors shared by all (K0, beta) nodes
+    # array H - table of shape (len(K0), len(beta), len(a))
+    #
+    # H is interpolated bilinearly in (K0, beta), with K0 and beta clipped to
+    # the grid, and with a cubic spline in ln(a); dH/da is the derivative of
+    # that spline. Beyond the grid of a, H is extrapolated linearly in a like
+    # the former interp1d tables.
+    ########################################################################
+
+    def __init__(self, K0, beta, a, H):
+        self.K0 = np.asarray(K0, dtype=np.float64)
+        self.beta = np.asarray(beta, dtype=np.float64)
+        self.a = np.asarray(a, dtype=np.float64)
+        self.H = H
+        self.splines = LRU_cache(maxsize=64)
+
+    """
+    Build the background table from the legacy array of interp1d objects.
+
+    Parameters:
+        H_int (array): (len(K0), len(beta)) object array of interp1d for H(a).
+        K0 (array): Grid of K0 values.
+        beta (array): Grid of beta values.
+
+    Returns:
+        kmoufl_background: The background table.
+    """
+
+    @classmethod
+    def from_interpolators(cls, H_int, K0, beta):
+        a = H_int[0, 0].x
+        H = np.empty((len(K0), len(beta), len(a)))
+        for i in range(len(K0)):
+            for j in range(len(beta)):
+                if not np.array_equal(H_int[i, j].x, a):
+                    raise Exception(
+                        "kmoufl tables are not tabulated on a common grid of a.")
+                H[i, j] = H_int[i, j].y
+        return cls(K0, beta, a, H)
+
+    """
+    Write the table in the numeric format read by load_kmoufl_background.
+
+    Parameters:
+        path (str, optional): Directory to write kmoufl_axes.npz and
+            kmoufl_H_table.npy to.
+    """
+
+    def save(self, path=kmoufl_table_path):
+        # Both files are renamed into place, so a reader never maps a partial
+        # table and a table mapped by another process is left untouched
+        with tempfile.NamedTemporaryFile(dir=path, suffix='.tmp', delete=False) as f:
+            np.save(f, np.ascontiguousarray(self.H, dtype=np.float64))
+            tmpname = f.name
+        os.replace(tmpname, os.path.join(path, 'kmoufl_H_table.npy'))
+        # The axes go last so that they only describe a complete table
+        with tempfile.NamedTemporaryFile(dir=path, suffix='.tmp', delete=False) as f:
+            np.savez(f, version=kmoufl_table_version,
+                     K0=self.K0, beta=self.beta, a=self.a)
+            tmpname = f.name
+        os.replace(tmpname, os.path.join(path, 'kmoufl_axes.npz'))
+
+    """
+    Calculate H(a) and dH/da for any combination of a, beta and K0.
+
+    Parameters:
+        a (float or array): The scale factor(s).
+        beta (float or array): The k-mouflage beta (par1).
+        K0 (float or array): The k-mouflage K0 (par2).
+
+    Returns:
+        tuple: (H, dH/da) broadcast over a, beta and K0.
+    """
+
+    def H_dH(self, a, beta, K0):
+        a, beta, K0 = np.broadcast_arrays(
+            np.asarray(a, dtype=np.float64), beta, K0)
+        H = np.empty(a.shape)
+        dH = np.empty(a.shape)
+        # One spline per distinct (beta, K0) pair
+        pairs, inverse = np.unique(
+            np.stack((beta.ravel(), K0.ravel())), axis=1, return_inverse=True)
+        inverse = np.reshape(inverse, a.shape)
+        for n in range(pairs.shape[1]):
+            mask = inverse == n
+            H[mask], dH[mask] = self.at(pairs[0, n], pairs[1, n])(a[mask])
+        return H[()], dH[()]
+
+    """
+    Blend the table to fixed (beta, K0) once and return a fast H(a), dH/da evaluator.
+
+    Parameters:
+        beta (float): The k-mouflage beta (par1).
+        K0 (float): The k-mouflage K0 (par2).
+
+    Returns:
+        callable: f(a) returning (H, dH/da), identical to H_dH(a, beta, K0).
+    """
+
+    def at(self, beta, K0):
+        key = (float(beta), float(K0))
+        H_dH = self.splines.get(key)
+        if H_dH is not None:
+            return H_dH
+
+        i, wK = grid_cells(self.K0, K0)
+        j, wb = grid_cells(self.beta, beta)
+        H = 0
+        for di, w_i in ((0, 1-wK), (1, wK)):
+            for dj, w_j in ((0, 1-wb), (1, wb)):
+                H = H + w_i*w_j*self.H[i+di, j+dj]
+        a_min = self.a[0]
+        a_max = self.a[-1]
+        spline = scipy.interpolate.CubicSpline(np.log(self.a), H)
+        derivative = spline.derivative()
+
+        def H_dH(a):
+            a_grid = np.clip(a, a_min, a_max)
+            x = np.log(a_grid)
+            dH = derivative(x)/a_grid
+            return spline(x) + dH*(a-a_grid), dH
+
+        self.splines.set(key, H_dH)
+        return H_dH
+
+
+kmoufl_tables = None
+
+
+"""
+Load the k-mouflage background tables.
+
+The numeric table is a float64 array of H with shape (len(K0), len(beta), len(a))
+and is memory-mapped, so processes forked from one parent share the pages.
+If it is missing, the legacy pickled kmoufl_H.npy is converted once and the
+numeric table written next to it (the same as "python -m JWST_MG.kmoufl");
+when the directory is read-only the converted table is only kept in memory.
+
+Parameters:
+    path (str, optional): Directory holding the tables.
+
+Returns:
+    kmoufl_background: The background tables.
+
+Raises:
+    Exception: If neither the numeric table nor the legacy table can be read.
+"""
+
+
+def load_kmoufl_background(path=kmoufl_table_path):
+    try:
+        with np.load(os.path.join(path, 'kmoufl_axes.npz')) as axes:
+            if int(axes['version']) == kmoufl_table_version:
+                return kmoufl_background(axes['K0'], axes['beta'], axes['a'],
+                                         np.load(os.path.join(path, 'kmoufl_H_table.npy'), mmap_mode='r'))
+    except (OSError, KeyError, ValueError):
+        pass
+
+    legacy = os.path.join(path, 'kmoufl_H.npy')
+    try:
+        tables = kmoufl_background.from_interpolators(
+            np.load(legacy, allow_pickle=True), K0_arr, beta_arr)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        # Also a git-lfs pointer in place of the legacy table
+        raise Exception("No kmoufl background table (version %d) in %s, and %s cannot be read. "
+                        "Fetch it with 'git lfs pull' and run 'python -m JWST_MG.kmoufl' from the "
+                        "repository root, or build the table with tables/kmoufl_tables.py."
+                        % (kmoufl_table_version, path, legacy))
+    logger.warning("Converting the legacy %s to the numeric kmoufl table (once).", legacy)
+    try:
+        tables.save(path)
+    except OSError as error:
+        logger.warning("Could not write the kmoufl table in %s (%s); using it from memory.",
+                       path, error)
+    return tables
+
+
+"""
+Get the k-mouflage background tables, loading them on first use.
+
+Returns:
+    kmoufl_background: The background tables.
+"""
+
+
+def get_kmoufl_background():
+    global kmoufl_tables
+    if kmoufl_tables is None:
+        kmoufl_tables = load_kmoufl_background()
+    return kmoufl_tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert the legacy pickled kmoufl tables to the numeric table read by JWST_MG.kmoufl.')
+    parser.add_argument('--legacy', default=os.path.join(kmoufl_table_path, 'kmoufl_H.npy'),
+                        help='pickled array of interp1d objects for H(a)')
+    parser.add_argument('--output', default=kmoufl_table_path,
+                        help='directory of the numeric table')
+    args = parser.parse_args()
+    kmoufl_background.from_interpolators(
+        np.load(args.legacy, allow_pickle=True), K0_arr, beta_arr).save(args.output)
@@ -1,5 +1,5 @@
 from JWST_MG.constants import *
-from JWST_MG.cosmological_functions import cosmological_functions
+from JWST_MG.cosmological_functions import cosmological_functions, kernel
 from JWST_MG.delta_c import delta_c
 from JWST_MG.HMF import HMF
 from JWST_MG.SMF import SMF
@@ -44,16 +44,14 @@ class reionization:
 
     def radius_evolution(self, y, a, model, model_H, par1, par2, a_arr):
         R, dRda = y
-        cosmological_library = cosmological_functions(
-        ai, model, model_H, par1, par2)
+        background = kernel(model, model_H, par1, par2)
         delta_nl = self.delta_nl_a(a)
-        H = cosmological_library.H_f(a, model_H, par1, par2)
-        dH = cosmological_library.dH_f(a, model_H, par1, par2)
+        H, dH = background.H_dH(a)
         Hprime = a*dH
         Rprime = a*dRda
 
         if model_H == "LCDM" or model_H == "wCDM":
-            mu = cosmological_library.mu(a, model, model_H, par1, par2)
+            mu = background.mu(a, H, dH)
             ddRda = (-Hprime/H*Rprime +
                  (1+Hprime/H)*R - Omegam0*a**(-3)*H0**2 /
                  (2*H**2) * mu*(R+a/ai)*delta_nl - a*dRda)/a**2
@@ -62,8 +60,7 @@ class reionization:
             beta = 1 + 2*H*par1/c*(1+H_dot/(3*H**2))
             epsilon = 8/(9*beta**2)*(H0*par1/c)**2*Omegam0*a**(-3)
             RRV = (epsilon*delta_nl)**(-1/3)
-            mu = cosmological_library.mu(
-                a, model, model_H, par1, par2, type='nonlinear', x=RRV)
+            mu = background.mu(a, H, dH, x=RRV)
             ddRda = (-Hprime/H*Rprime +
                      (1+Hprime/H)*R - Omegam0*a**(-3)*H0**2 /
                      (2*H**2) * mu*(R+a/ai)*delta_nl - a*dRda)/a**2
@@ -98,12 +95,10 @@ class reionization:
     def virial_theorem(self, model, model_H, par1, par2, a_arr):
         G = 1/(8*np.pi)
         ac = a_arr[-1]
-        cosmological_library = cosmological_functions(
-            ac, model, model_H, par1, par2)
         R_arr = self.radius_solve(
             model, model_H, par1, par2, a_arr)
-        H_arr = cosmological_library.H_f(a_arr, model_H, par1, par2)
-        dH_arr = cosmological_library.dH_f(a_arr, model_H, par1, par2)
+        background = kernel(model, model_H, par1, par2)
+        H_arr, dH_arr = background.H_dH(a_arr)
         delta_nl = self.delta_nl_a(a_arr)
 
         R_arr[R_arr == -inf] = 0
@@ -120,15 +115,14 @@ class reionization:
         T = 3/10*M*Rdot**2
 
         if model_H == "LCDM" or model_H == "wCDM" or model_H == "kmoufl":
-            mu_arr = cosmological_library.mu(a_arr, model, model_H, par1, par2)
+            mu_arr = background.mu(a_arr, H_arr, dH_arr)
             U = -3/5*G*mu_arr*M*deltaM/R_arr+3/5*(H_dot+H_arr**2)*M*R_arr**2
             virial = T+1/2*U
         elif model_H == "nDGP":
             beta = 1 + 2*H_arr*par1/c*(1+H_dot/(3*H_arr**2))
             epsilon = 8/(9*beta**2)*(H0*par1/c)**2*Omegam0*a_arr**(-3)
             RRV = (epsilon*delta_nl)**(-1/3)
-            mu_arr = cosmological_library.mu(
-                a_arr, model, model_H, par1, par2, type='nonlinear', x=RRV)
+            mu_arr = background.mu(a_arr, H_arr, dH_arr, x=RRV)
             Geff = G*mu_arr
             DeltaGeff = Geff - G
             U = -3/5*G*M**2/R_arr - 3/5*DeltaGeff*M * \
@@ -168,19 +162,17 @@ class reionization:
 
     def minimum_Mhalo(self, model, model_H, par1, par2, a_arr):
         ac = a_arr[-1]
-        cosmological_library = cosmological_functions(
-            ac, model, model_H, par1, par2)
+        background = kernel(model, model_H, par1, par2)
+        H, dH = background.H_dH(ac)
         if model != "nDGP":
             a_vir, Deltavir = self.Delta_vir(
                 model, model_H, par1, par2, a_arr)
-            mu = cosmological_library.mu(ac, model, model_H, par1, par2)
+            mu = background.mu(ac, H, dH)
         else:
             a_vir, Deltavir, ac_arr, mu_arr  = self.Delta_vir(
                 model, model_H, par1, par2, a_arr)
             mu = mu_arr[np.argmin(np.abs(ac_arr-ac))]
 
-        H = cosmological_library.H_f(ac, model_H, par1, par2)
-        dH = cosmological_library.dH_f(ac, model_H, par1, par2)
         H_dot = ac*H*dH
 
         Tmin = 10000
@@ -218,10 +210,8 @@ class reionization:
         H = cosmological_library.H_f(a_int, model_H, par1, par2)
         H = scipy.interpolate.interp1d(a_int, H, fill_value='extrapolate')
         
-        Pk_arr = []
-        for i, z_i in enumerate(z_int):
-            HMF_library = HMF(1/(1+z_i), model, model_H, par1, par2, 1e8)
-            Pk_arr.append(np.array(HMF_library.Pk(1/(1+z_i), model, par1, par2))*h**3)
+        HMF_library = HMF(a0, model, model_H, par1, par2, 1e8)
+        Pk_arr = HMF_library.Pk_multi(z_int, model, par1, par2)*h**3
         k = kvec/h
 
         iterable = [(1/(1+z), rhoM, model, model_H,
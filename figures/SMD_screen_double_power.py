@@ -3,7 +3,7 @@ sys.path.insert(0, "../")
 
 from JWST_MG.UVLF import UVLF
 from JWST_MG.SMD import SMD
-from JWST_MG.HMF import HMF
+from JWST_MG.HMF import HMF, halo_stage
 from JWST_MG.reionization import reionization
 from JWST_MG.delta_c import delta_c
 from multiprocessing import Pool, Queue
@@ -98,8 +98,10 @@ k = kvec/h
 Masses = np.logspace(8,16,1000)
 
 pool_cpu = Pool(8)
-iterable = [(Masses, rhom, 1/(1+z), model_H, model, model_SFR, par1, par2, k, Pk_arr[i], f0) for i,par1 in enumerate(pars1)]
-Masses_stars, SMDs = zip(*pool_cpu.starmap(SMD_library.SMD,tqdm(iterable, total=len(pars1))))
+iterable = [(Masses, rhom, 1/(1+z), model_H, model, par1, par2, k, Pk_arr[i]) for i,par1 in enumerate(pars1)]
+HMFs = pool_cpu.starmap(halo_stage,tqdm(iterable, total=len(pars1)))
+# All mass functions of the panel are integrated at once
+Masses_stars, SMDs = SMD_library.SMD_from_HMF(Masses, np.array(HMFs), 1/(1+z), model_SFR, f0)
 
 
 #print(SMF)
@@ -174,8 +176,10 @@ k = kvec/h
 Masses = np.logspace(8,16,1000)
 
 pool_cpu = Pool(8)
-iterable = [(Masses, rhom, 1/(1+z), model_H, model, model_SFR, par1, par2, k, Pk_arr[i], f0) for i,par1 in enumerate(pars1)]
-Masses_stars, SMDs = zip(*pool_cpu.starmap(SMD_library.SMD,tqdm(iterable, total=len(pars1))))
+iterable = [(Masses, rhom, 1/(1+z), model_H, model, par1, par2, k, Pk_arr[i]) for i,par1 in enumerate(pars1)]
+HMFs = pool_cpu.starmap(halo_stage,tqdm(iterable, total=len(pars1)))
+# All mass functions of the panel are integrated at once
+Masses_stars, SMDs = SMD_library.SMD_from_HMF(Masses, np.array(HMFs), 1/(1+z), model_SFR, f0)
 
 
 #print(SMF)
@@ -251,8 +255,10 @@ for j, par1 in enumerate(pars1):
     Masses = np.logspace(8,16,1000)
 
     pool_cpu = Pool(8)
-    iterable = [(Masses, rhom, 1/(1+z), model_H, model, model_SFR, par1, par2, k, Pk_arr[i], f0) for i,par2 in enumerate(pars2)]
-    Masses_stars, SMDs = zip(*pool_cpu.starmap(SMD_library.SMD,tqdm(iterable, total=len(pars2))))
+    iterable = [(Masses, rhom, 1/(1+z), model_H, model, par1, par2, k, Pk_arr[i]) for i,par2 in enumerate(pars2)]
+    HMFs = pool_cpu.starmap(halo_stage,tqdm(iterable, total=len(pars2)))
+    # All mass functions of the panel are integrated at once
+    Masses_stars, SMDs = SMD_library.SMD_from_HMF(Masses, np.array(HMFs), 1/(1+z), model_SFR, f0)
 
 
     #print(SMF)
@@ -344,8 +350,10 @@ for j, par1 in enumerate(pars1):
     Masses = np.logspace(8,16,1000)
 
     pool_cpu = Pool(8)
-    iterable = [(Masses, rhom, 1/(1+z), model_H, model, model_SFR, par1, par2, k, Pk_arr[i], f0) for i,par2 in enumerate(pars2)]
-    Masses_stars, SMDs = zip(*pool_cpu.starmap(SMD_library.SMD,tqdm(iterable, total=len(pars2))))
+    iterable = [(Masses, rhom, 1/(1+z), model_H, model, par1, par2, k, Pk_arr[i]) for i,par2 in enumerate(pars2)]
+    HMFs = pool_cpu.starmap(halo_stage,tqdm(iterable, total=len(pars2)))
+    # All mass functions of the panel are integrated at once
+    Masses_stars, SMDs = SMD_library.SMD_from_HMF(Masses, np.array(HMFs), 1/(1+z), model_SFR, f0)
 
 
     #print(SMF)
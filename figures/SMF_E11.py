@@ -567,7 +567,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -595,7 +595,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -717,7 +717,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -752,7 +752,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -480,7 +480,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -508,7 +508,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -631,7 +631,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -666,7 +666,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -468,7 +468,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -496,7 +496,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -619,7 +619,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -654,7 +654,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
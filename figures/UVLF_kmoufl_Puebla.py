@@ -975,7 +975,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -1003,7 +1003,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -1124,7 +1124,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -1159,7 +1159,7 @@ deltac = delta_c(ac_arr, model, model_H, par1, par2)
 di = deltac.binary_search_di(1, model, model_H, par1, par2,
                              0, len(delta_ini)-1, abs_err)
 print(di)
-delta_nl = deltac.collapse(di, model, model_H, par1, par2)
+delta_nl = deltac.collapse_history(di, model, model_H, par1, par2)
 delta = delta_nl[:, 1]
 a = delta_nl[:, 0]
 cosmological_library = cosmological_functions(
@@ -90,13 +90,9 @@ cmap3 = matplotlib.colors.LinearSegmentedColormap.from_list("", ["white","#48639
 
 colors = cmap3(np.linspace(0, 1, n))
 for i in tqdm(range(len(pars1))):
-    Delta = []
     par1 = pars1[i]
-    for ac in ac_arr:
-        deltac = delta_c(ac, model, model_H, par1, par2)
-        dc = deltac.delta_c_at_ac(ac, model, model_H, par1, par2)
-        Delta.append(dc)
-        # print(Deltavir)
+    Delta = delta_c(ac_arr, model, model_H, par1, par2).delta_c_curve(
+        ac_arr, model, model_H, par1, par2)
     plt.plot(ac_arr, Delta, c=colors[i], lw=1)
 
 
@@ -144,13 +140,9 @@ cmap3 = matplotlib.colors.LinearSegmentedColormap.from_list("", ["white","#48639
 
 colors = cmap3(np.linspace(0, 1, n))
 for i in tqdm(range(len(pars1))):
-    Delta = []
     par1 = pars1[i]
-    for ac in ac_arr:
-        deltac = delta_c(ac, model, model_H, par1, par2)
-        dc = deltac.delta_c_at_ac(ac, model, model_H, par1, par2)
-        Delta.append(dc)
-        # print(Deltavir)
+    Delta = delta_c(ac_arr, model, model_H, par1, par2).delta_c_curve(
+        ac_arr, model, model_H, par1, par2)
     plt.plot(ac_arr, Delta, c=colors[i], lw=1)
 
 
@@ -203,13 +195,9 @@ colors = np.array([cmap1(np.linspace(0, 1, n)), cmap2(np.linspace(0, 1, n)), cma
 for j in tqdm(range(len(pars1))):
     par1 = pars1[j]
     for i in range(len(pars2)):
-        Delta = []
         par2 = pars2[i]
-        for ac in ac_arr:
-            deltac = delta_c(ac, model, model_H, par1, par2)
-            dc = deltac.delta_c_at_ac(ac, model, model_H, par1, par2)
-            Delta.append(dc)
-            # print(Deltavir)
+        Delta = delta_c(ac_arr, model, model_H, par1, par2).delta_c_curve(
+            ac_arr, model, model_H, par1, par2)
         plt.plot(ac_arr, Delta, c=colors[j][i], alpha=0.5, lw=1)
 
 
@@ -275,13 +263,9 @@ colors = np.array([cmap1(np.linspace(0, 1, n)), cmap2(np.linspace(0, 1, n)), cma
 for j in tqdm(range(len(pars1))):
     par1 = pars1[j]
     for i in range(len(pars2)):
-        Delta = []
         par2 = pars2[i]
-        for ac in ac_arr:
-            deltac = delta_c(ac, model, model_H, par1, par2)
-            dc = deltac.delta_c_at_ac(ac, model, model_H, par1, par2)
-            Delta.append(dc)
-            # print(Deltavir)
+        Delta = delta_c(ac_arr, model, model_H, par1, par2).delta_c_curve(
+            ac_arr, model, model_H, par1, par2)
         plt.plot(ac_arr, Delta, c=colors[j][i], alpha=0.5, lw=1)
 
 
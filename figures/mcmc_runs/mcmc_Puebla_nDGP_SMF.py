@@ -7,40 +7,14 @@ from JWST_MG.HMF import HMF
 from JWST_MG.SMF import SMF
 from JWST_MG.SMD import SMD
 from JWST_MG.UVLF import UVLF
+from JWST_MG.GSMF_data import load_GSMF_data
 import zeus
 plt.rcParams.update({"text.usetex": True})
 from tqdm.contrib.concurrent import process_map  # or thread_map
 
 
-x = [[],[],[],[],[],[],[],[],[],[],[]]
-y = [[],[],[],[],[],[],[],[],[],[],[]]
-yerr = [[],[],[],[],[],[],[],[],[],[],[]]
-
 zs = [0,1,1.75,4,5,6,7,8]
-
-for i in range(len(zs)):
-    obs = number_density(feature='GSMF', z_target=zs[i], h=h)
-    j_data = 0
-    k_func = 0
-    if zs[i] == 8:
-        pass
-    else:
-        for ii in range(obs.n_target_observation):
-            data       = obs.target_observation['Data'][ii]
-            datatype   = obs.target_observation['DataType'][ii]
-            if datatype == 'data':
-                x[i] = np.concatenate((x[i], 10**data[:,0]), axis=None)
-                y[i] = np.concatenate((y[i], data[:,1]), axis=None)
-                yerr[i] = np.concatenate((yerr[i], data[:,1]-data[:,3]+data[:,2]- data[:,1]), axis=None)
-
-                j_data +=1
-    
-    if zs[i] in [4,5,6,7,8]:
-        path = '../observational_data/GSMF'
-        Navarro = np.loadtxt(path + "/Navarro_z"+str(zs[i])+".dat")
-        x[i] = np.concatenate((x[i], 10**Navarro[:,0]), axis=None)
-        y[i] = np.concatenate((y[i], 1e-4*Navarro[:,1]), axis=None)
-        yerr[i] = np.concatenate((yerr[i], 2*1e-4*Navarro[:,2]), axis=None)
+x, y, yerr = load_GSMF_data(zs)
 
 
 model = 'nDGP'
@@ -51,10 +25,8 @@ f0 = 0.1
 
 
 
-def SMF_func(z, par1):
+def SMF_func(z, par1, Pk):
     SMF_library = SMF(1/(1+z), model, model_H, model_SFR, par1, par2, 1e8)
-    HMF_library = HMF(1/(1+z), model, model_H, par1, par2, 1e8)
-    Pk = np.array(HMF_library.Pk(1/(1+z), model, par1, par2))*h**3
     k = kvec/h
     Masses = np.logspace(6,16,100)
     Masses_star, SMF_sample = SMF_library.SMF_obs(Masses, rhom, 1/(1+z), model_H, model, model_SFR, par1, par2, k, Pk, f0)
@@ -64,8 +36,9 @@ def SMF_func(z, par1):
 def SMF_single(log_par1):
     result = 0
     par1 = 10**log_par1
+    Pk_arr = HMF(1, model, model_H, par1, par2, 1e8).Pk_multi(zs, model, par1, par2)*h**3
     for k, zi in enumerate(zs):
-        Masses_star, SMF_sample = SMF_func(zi, par1)
+        Masses_star, SMF_sample = SMF_func(zi, par1, Pk_arr[k])
         y_th = scipy.interpolate.interp1d(Masses_star, SMF_sample, fill_value='extrapolate')(x[k])
         sigma2 = yerr[k]**2
         result += -0.5 * np.sum((y[k] - y_th) ** 2 / sigma2 + np.log(sigma2))
@@ -7,60 +7,33 @@ from JWST_MG.HMF import HMF
 from JWST_MG.SMF import SMF
 from JWST_MG.SMD import SMD
 from JWST_MG.UVLF import UVLF
+from JWST_MG.GSMF_data import load_GSMF_data
 import zeus
 plt.rcParams.update({"text.usetex": True})
 
-x = [[],[],[],[],[],[],[],[],[],[],[]]
-y = [[],[],[],[],[],[],[],[],[],[],[]]
-yerr = [[],[],[],[],[],[],[],[],[],[],[]]
-
 zs = [0,1,1.75,4,5,6,7, 8]
-
-for i in range(len(zs)):
-    obs = number_density(feature='GSMF', z_target=zs[i], h=h)
-    j_data = 0
-    k_func = 0
-    if zs[i] == 8:
-        pass
-    else:
-        for ii in range(obs.n_target_observation):
-            data       = obs.target_observation['Data'][ii]
-            datatype   = obs.target_observation['DataType'][ii]
-            if datatype == 'data':
-                x[i] = np.concatenate((x[i], 10**data[:,0]), axis=None)
-                y[i] = np.concatenate((y[i], data[:,1]), axis=None)
-                yerr[i] = np.concatenate((yerr[i], data[:,1]-data[:,3]+data[:,2]- data[:,1]), axis=None)
-
-                j_data +=1
-    
-    if zs[i] in [4,5,6,7,8]:
-        path = '../observational_data/GSMF'
-        Navarro = np.loadtxt(path + "/Navarro_z"+str(zs[i])+".dat")
-        x[i] = np.concatenate((x[i], 10**Navarro[:,0]), axis=None)
-        y[i] = np.concatenate((y[i], 1e-4*Navarro[:,1]), axis=None)
-        yerr[i] = np.concatenate((yerr[i], 2*1e-4*Navarro[:,2]), axis=None)
+x, y, yerr = load_GSMF_data(zs)
 
 
 model = 'gmu'
 model_H = 'LCDM'
 model_SFR = 'double_power'
 
-def SMF_func(z, par1, par2, f0):
+def SMF_func(z, par1, par2, f0, Pk):
     SMF_library = SMF(1/(1+z), model, model_H, model_SFR, par1, par2, 1e8, f0)
-    HMF_library = HMF(1/(1+z), model, model_H, par1, par2, 1e8)
-    Pk = np.array(HMF_library.Pk(1/(1+z), model, par1, par2))*h**3
     k = kvec/h
     Masses = np.logspace(6,16,100)
     Masses_star, SMF_sample = SMF_library.SMF_obs(Masses, rhom, 1/(1+z), model_H, model, model_SFR, par1, par2, k, Pk, f0)
     return Masses_star, SMF_sample
 
 def SMF_single(par1, par2, f0):
-    result = 0
+    result = np.zeros(np.shape(f0))
+    Pk_arr = HMF(1, model, model_H, par1, par2, 1e8).Pk_multi(zs, model, par1, par2)*h**3
     for k, zi in enumerate(zs):
-        Masses_star, SMF_sample = SMF_func(zi, par1, par2, f0)
+        Masses_star, SMF_sample = SMF_func(zi, par1, par2, f0, Pk_arr[k])
         y_th = scipy.interpolate.interp1d(Masses_star, SMF_sample, fill_value='extrapolate')(x[k])
         sigma2 = yerr[k]**2
-        result += -0.5 * np.sum((y[k] - y_th) ** 2 / sigma2 + np.log(sigma2))
+        result += -0.5 * np.sum((y[k] - y_th) ** 2 / sigma2 + np.log(sigma2), axis=-1)
 
     return result
 
@@ -84,23 +57,24 @@ class LinearNDInterpolatorExt(object):
 
 
 def log_likelihood_interpolated(x, y, yerr):
-    sampler = qmc.LatinHypercube(d=3)
+    sampler = qmc.LatinHypercube(d=2)
     sample = sampler.random(n=400)
-    l_bounds = [0,0,0.001]
-    u_bounds = [3,3,1]
+    l_bounds = [0,0]
+    u_bounds = [3,3]
     sample_scaled = qmc.scale(sample, l_bounds, u_bounds)
     par1_span = sample_scaled[:,0]
     par2_span = sample_scaled[:,1]
-    f0_span = sample_scaled[:,2]
-    #xx, yy = np.meshgrid(log_par1_span, f0_span)
+    f0_span = np.geomspace(0.001, 1, 40)
+    # One cosmology per task; SMF_single evaluates all f0 values at once on a
+    # log grid, which resolves the fast variation of the SMF at small f0
     iterable = []
-    for par1, par2, f0 in zip(par1_span,par2_span,f0_span):
-        iterable.append([par1,par2,f0])
-    #result = zip(*pool_cpu.starmap(SMF_single,tqdm(iterable, total=len(log_par1)*len(f0_span))))
+    for par1, par2 in zip(par1_span,par2_span):
+        iterable.append([par1,par2,f0_span])
 
     result = np.array(progress_starmap(SMF_single, iterable, n_cpu=None))
 
-    interpolated_likelihood = LinearNDInterpolatorExt(list(zip(par1_span, par2_span, f0_span)),result)
+    points = [(par1, par2, f0) for par1, par2 in zip(par1_span, par2_span) for f0 in f0_span]
+    interpolated_likelihood = LinearNDInterpolatorExt(points,result.ravel())
     return interpolated_likelihood
 
 #log_likelihood_int = log_likelihood_interpolated(x, y, yerr)
@@ -0,0 +1,81 @@
+import sys
+sys.path.insert(0, "../")
+from JWST_MG.constants import *
+from JWST_MG.delta_c import delta_c, deltac_table_version, deltac_table_path
+
+# Generate the delta_c tables read by JWST_MG.delta_c, e.g.
+#     python delta_c_tables.py LCDM,LCDM E11,LCDM nDGP,nDGP
+# from this directory (all pairs without arguments). Each node is one batched
+# delta_c_curve, which agrees with the per-ac shooting solve to a few 1e-6.
+
+# Grids of (par1, par2) for each (model, model_H) pair, together with the
+# flags for interpolation in log(ac), log(par1), log(par2).
+# A single-node axis marks a parameter that delta_c does not depend on. The
+# grids cover at least the priors of the likelihoods in figures/mcmc_runs.
+ac_arr = np.geomspace(0.01, 1, 41)
+grids = {('LCDM', 'LCDM'): ([0], [0], [True, False, False]),
+         ('E11', 'LCDM'): (np.linspace(-1, 2, 31), [0], [True, False, False]),
+         ('gmu', 'LCDM'): (np.linspace(0, 3, 31), [0], [True, False, False]),
+         ('DES', 'LCDM'): (np.linspace(-1, 1, 11), np.linspace(-1, 1, 21), [True, False, False]),
+         ('wCDM', 'wCDM'): (np.linspace(-3, 0, 31), np.linspace(0.4, 0.8, 21), [True, False, False]),
+         ('nDGP', 'nDGP'): (np.logspace(2, 8, 61), [0], [True, True, False]),
+         ('kmoufl', 'kmoufl'): (beta_arr, K0_arr, [True, False, False])}
+
+
+def latest_collapse(deltac, model, model_H, par1, par2, n_bisect=40):
+    # Collapse of the smallest deltai that still collapses before a = 2,
+    # found by bisection in log(deltai)
+    ac = deltac.collapse(delta_ini[0], model, model_H, par1, par2)
+    if ac < 1/(1-0.5):
+        return ac
+    low, high = np.log(delta_ini[0]), np.log(delta_ini[-1])
+    for i in range(n_bisect):
+        middle = 0.5*(low+high)
+        if deltac.collapse(np.exp(middle), model, model_H, par1, par2) < 1/(1-0.5):
+            high = middle
+        else:
+            low = middle
+    return deltac.collapse(np.exp(high), model, model_H, par1, par2)
+
+
+def deltac_node(model, model_H, par1, par2):
+    deltac = delta_c(ac_arr, model, model_H, par1, par2)
+    # Collapse times reachable from the range of delta_ini; nodes outside of
+    # it stay NaN, so delta_c_at_ac falls back to the direct solve there.
+    # Where mu turns small at late times (wCDM with w << -1) perturbations
+    # below a threshold never collapse and ac jumps from below 1 to a = 2,
+    # so the latest collapse is that of the threshold itself.
+    ac_min = deltac.collapse(delta_ini[-1], model, model_H, par1, par2)
+    ac_max = latest_collapse(deltac, model, model_H, par1, par2)
+    covered = (ac_arr > ac_min) & (ac_arr < ac_max)
+    # Close below such a jump the fine batch of delta_c_curve hardly samples
+    # deltai(ac), so these nodes are solved by shooting
+    edge = covered & (ac_arr > ac_max/1.5)
+    values = np.full(len(ac_arr), np.nan)
+    if np.any(covered & ~edge):
+        values[covered & ~edge] = deltac.delta_c_curve(
+            ac_arr[covered & ~edge], model, model_H, par1, par2)
+    for i in np.flatnonzero(edge):
+        values[i] = deltac.delta_c_at_ac(
+            ac_arr[i], model, model_H, par1, par2, use_table=False)
+    return values
+
+
+if __name__ == '__main__':
+    models = grids.keys()
+    if len(sys.argv) > 1:
+        models = [tuple(arg.split(',')) for arg in sys.argv[1:]]
+
+    os.makedirs(deltac_table_path, exist_ok=True)
+    pool_cpu = Pool(8)
+    for model, model_H in models:
+        pars1, pars2, log_axes = grids[(model, model_H)]
+        iterable = [(model, model_H, par1, par2)
+                    for par1 in pars1 for par2 in pars2]
+        result = pool_cpu.starmap(deltac_node, tqdm(iterable, total=len(iterable)))
+        deltac = np.transpose(np.reshape(
+            result, (len(pars1), len(pars2), len(ac_arr))), (2, 0, 1))
+
+        np.savez(os.path.join(deltac_table_path, 'delta_c_%s_%s.npz' % (model, model_H)),
+                 version=deltac_table_version, ai=ai, abs_err=abs_err,
+                 ac=ac_arr, par1=pars1, par2=pars2, log_axes=log_axes, deltac=deltac)
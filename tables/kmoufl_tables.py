@@ -1,42 +1,103 @@
+import sys
+import argparse
+import hashlib
+import json
+import tempfile
+sys.path.insert(0, "../")
+from JWST_MG.constants import *
+from JWST_MG.kmoufl import kmoufl_background, kmoufl_table_path
 
-import numpy as np
-import matplotlib.pyplot as plt
-import scipy as sp
-from scipy.integrate import odeint
-from scipy import integrate
-from scipy.special import lambertw
-from matplotlib.ticker import (MultipleLocator, AutoMinorLocator)
-import matplotlib.pylab as pl
-import matplotlib as mpl
-import matplotlib
-from scipy import interpolate
-import scipy
-from JWST_MG.UVLF import UVLF
-from JWST_MG.HMF import HMF
-from JWST_MG.reionization import reionization
-from JWST_MG.delta_c import delta_c
+# Build the k-mouflage background table H(a) on a (K0, beta) grid.
+# Every (K0, beta) node is one MGCLASS run written to its own file in
+# --nodes as soon as it finishes. Files are named by the parameter values, so
+# an interrupted run resumes where it stopped and a refined grid reuses every
+# node it shares with a coarser one. Nodes computed with different CLASS
+# settings or another grid of a are recomputed.
 
-from JWST_MG.constants import *
 
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-
-for i in range(len(K0_arr)):
-    for j in tqdm(range(len(beta_arr))):
-        kmfl_settings['beta_kmfl'] = beta_arr[j]
-        kmfl_settings['k0_kmfl'] = K0_arr[i]
-
-        cosmo_kmfl = Class()
-        cosmo_kmfl.set(kmfl_settings)
-        cosmo_kmfl.compute()
-        a = np.logspace(-6, 0, 10000)
-        H_arr_kmoufl[i, j] = ([cosmo_kmfl.Hubble(1/ai-1)*c for ai in a])
-        dH_arr_kmoufl[i, j] = (np.gradient(H_arr_kmoufl[i][j])/np.gradient(a))
-        H_int_kmoufl[i, j] = (scipy.interpolate.interp1d(
-            a, H_arr_kmoufl[i][j], fill_value='extrapolate'))
-        dH_int_kmoufl[i, j] = (scipy.interpolate.interp1d(
-            a, dH_arr_kmoufl[i][j], fill_value='extrapolate'))
-
-np.save('kmoufl_H', H_int_kmoufl)
-np.save('kmoufl_dH', dH_int_kmoufl)
+def node_filename(nodes_path, K0, beta):
+    return os.path.join(nodes_path, 'kmoufl_K0_%.10g_beta_%.10g.npz' % (K0, beta))
+
+
+def node_key(a):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(kmfl_settings, sort_keys=True, default=float).encode())
+    digest.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def node_done(filename, key):
+    try:
+        with np.load(filename) as node:
+            return str(node['key']) == key
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def background_H(background, a):
+    # CLASS lists the background by increasing time (decreasing z); sort by
+    # ln a anyway so that the spline never depends on that order
+    lna = -np.log(1+background['z'])
+    order = np.argsort(lna)
+    lnH = scipy.interpolate.CubicSpline(
+        lna[order], np.log(background['H [1/Mpc]'][order]*c))
+    return np.exp(lnH(np.log(a)))
+
+
+def kmoufl_node(K0, beta, a, nodes_path, key):
+    settings = dict(kmfl_settings)
+    settings['beta_kmfl'] = beta
+    settings['k0_kmfl'] = K0
+
+    cosmo_kmfl = Class()
+    cosmo_kmfl.set(settings)
+    cosmo_kmfl.compute()
+    # The whole background table at once instead of one Hubble(z) call per a
+    background = cosmo_kmfl.get_background()
+    cosmo_kmfl.struct_cleanup()
+    H = background_H(background, a)
+
+    filename = node_filename(nodes_path, K0, beta)
+    with tempfile.NamedTemporaryFile(dir=nodes_path, suffix='.tmp', delete=False) as f:
+        np.savez(f, key=key, K0=K0, beta=beta, H=H)
+        tmpname = f.name
+    os.replace(tmpname, filename)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the kmoufl background table read by JWST_MG.kmoufl.')
+    parser.add_argument('--K0', nargs=3, type=float, default=[K0_arr[0], K0_arr[-1], len(K0_arr)],
+                        metavar=('MIN', 'MAX', 'N'), help='linear grid of K0')
+    parser.add_argument('--beta', nargs=3, type=float, default=[beta_arr[0], beta_arr[-1], len(beta_arr)],
+                        metavar=('MIN', 'MAX', 'N'), help='linear grid of beta')
+    parser.add_argument('--a', nargs=3, type=float, default=[1e-6, 1, 10000],
+                        metavar=('MIN', 'MAX', 'N'), help='logarithmic grid of the scale factor')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--nodes', default=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'kmoufl_nodes'),
+                        help='directory of the per-node files')
+    parser.add_argument('--output', default=kmoufl_table_path,
+                        help='directory of the assembled table')
+    args = parser.parse_args()
+
+    K0_grid = np.linspace(args.K0[0], args.K0[1], int(args.K0[2]))
+    beta_grid = np.linspace(args.beta[0], args.beta[1], int(args.beta[2]))
+    a = np.geomspace(args.a[0], args.a[1], int(args.a[2]))
+    key = node_key(a)
+
+    os.makedirs(args.nodes, exist_ok=True)
+    iterable = [(K0, beta, a, args.nodes, key) for K0 in K0_grid for beta in beta_grid
+                if not node_done(node_filename(args.nodes, K0, beta), key)]
+    print('%d of %d nodes left to compute' %
+          (len(iterable), len(K0_grid)*len(beta_grid)))
+    if len(iterable) > 0:
+        pool_cpu = Pool(args.processes)
+        pool_cpu.starmap(kmoufl_node, tqdm(iterable, total=len(iterable)))
+        pool_cpu.close()
+
+    H = np.empty((len(K0_grid), len(beta_grid), len(a)))
+    for i in range(len(K0_grid)):
+        for j in range(len(beta_grid)):
+            with np.load(node_filename(args.nodes, K0_grid[i], beta_grid[j])) as node:
+                H[i, j] = node['H']
+    kmoufl_background(K0_grid, beta_grid, a, H).save(args.output)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import JWST_MG.GSMF_data as GSMF_data
+from JWST_MG.GSMF_data import GSMF_points, build_GSMF_data, load_GSMF_data
+
+
+zs = [1, 4, 8]
+
+
+class fake_number_density:
+    # Two data sets and one upper limit per redshift, like astrodatapy
+    def __init__(self, feature, z_target, h):
+        assert feature == 'GSMF'
+        logM = np.linspace(8, 11, 4) + 0.1*z_target
+        phi = 1e-3/(1+z_target)*np.ones(4)
+        data = np.column_stack((logM, phi, 1.2*phi, 0.9*phi))
+        self.target_observation = {'Data': [data, data[:2]*1.01, data[1:]],
+                                   'DataType': ['data', 'data', 'upper']}
+        self.n_target_observation = 3
+
+
+@pytest.fixture
+def observations(tmp_path, monkeypatch):
+    monkeypatch.setattr(GSMF_data, 'number_density', fake_number_density)
+    (tmp_path / 'GSMF').mkdir()
+    for z in [4, 8]:
+        np.savetxt(tmp_path / 'GSMF' / ('Navarro_z%g.dat' % z),
+                   np.column_stack((np.linspace(9, 10, 3), np.full(3, 2.0+z), np.full(3, 0.5))))
+    return tmp_path
+
+
+def test_load_matches_points(observations):
+    build_GSMF_data(zs, str(observations))
+    x, y, yerr = load_GSMF_data(zs, str(observations))
+    for i, z in enumerate(zs):
+        assert isinstance(x[i].base, np.memmap)
+        for loaded, point in zip((x[i], y[i], yerr[i]), GSMF_points(z, str(observations))):
+            np.testing.assert_array_equal(loaded, point)
+    # Only the 'data' entries at z = 1, only Navarro at z = 8
+    assert len(x[0]) == 6
+    assert len(x[1]) == 9
+    assert len(x[2]) == 3
+
+
+def test_load_builds_missing_and_stale_data(observations, monkeypatch):
+    x = load_GSMF_data(zs, str(observations))[0]
+    assert [len(xi) for xi in x] == [6, 9, 3]
+    # Other redshifts than the prepared ones rebuild the vectors
+    x = load_GSMF_data([4, 8], str(observations))[0]
+    assert [len(xi) for xi in x] == [9, 3]
+
+    def build(zs, path):
+        raise AssertionError('rebuilt up-to-date GSMF data')
+    monkeypatch.setattr(GSMF_data, 'build_GSMF_data', build)
+    load_GSMF_data([4, 8], str(observations))
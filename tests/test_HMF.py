@@ -0,0 +1,173 @@
+import importlib.util
+import logging
+import numpy as np
+import pytest
+import scipy.integrate
+
+from JWST_MG.constants import kvec, rhom, sigma_rtol, h
+from JWST_MG.HMF import HMF, HMF_cache, SigmaTable, sigma_many, variance_k_grid
+
+
+# Regression checks of the vectorized variance integrals against quad, the
+# original odeint integration and the finite-difference dsigma/dM. Only the
+# odeint references (HMF.sigma) need integration_library (Pylians); none of
+# the tests needs MGCLASS.
+requires_pylians = pytest.mark.skipif(importlib.util.find_spec("integration_library") is None,
+                                      reason="integration_library (Pylians) is not installed")
+requires_classy = pytest.mark.skipif(importlib.util.find_spec("classy") is None,
+                                     reason="classy (MGCLASS) is not installed")
+
+
+def reference_Pk(k):
+    # BBKS transfer function, normalised to sigma ~ 1 at 1e14 Msun
+    q = k/(0.3*h**2)
+    T = np.log(1+2.34*q)/(2.34*q)*(1+3.89*q+(16.1*q)**2 +
+                                    (5.46*q)**3+(6.71*q)**4)**(-0.25)
+    return 4e6*k**0.9665*T**2
+
+
+k = kvec/h
+Pk = reference_Pk(k)
+Masses = np.logspace(8, 15, 8)
+R = (3.0*Masses/(4.0*np.pi*rhom*3.3**3))**(1.0/3.0)
+
+
+def sigma_quad(R):
+    # sigma and dsigma/dR of the analytic P(k) over the range of k
+    def integrand(lnk, derivative):
+        k = np.exp(lnk)
+        x = (k*R)**4.8
+        W = 1/(1+x)
+        dsigma2 = reference_Pk(k)*k**3/(2.0*np.pi**2)
+        return dsigma2*(-2*4.8/R*x*W**3 if derivative else W**2)
+    sigma2, dsigma2dR = (scipy.integrate.quad(integrand, np.log(k[0]), np.log(k[-1]), args=(derivative,),
+                                              limit=1000, epsrel=1e-10)[0]
+                         for derivative in (False, True))
+    return np.sqrt(sigma2), dsigma2dR/(2*np.sqrt(sigma2))
+
+
+sigma_ref, dsigma_dR_ref = np.transpose([sigma_quad(Ri) for Ri in R])
+
+
+@pytest.fixture(scope='module')
+def library():
+    return HMF(1, 'LCDM', 'LCDM', 0, 0, Masses)
+
+
+def dSdM_finite_difference(library, M):
+    # The former dSdM: forward difference of the odeint sigma
+    M2 = M*1.0001
+    R1 = (3.0*M/(4.0*np.pi*rhom*3.3**3))**(1.0/3.0)
+    R2 = (3.0*M2/(4.0*np.pi*rhom*3.3**3))**(1.0/3.0)
+    return (library.sigma(k, Pk, R2)-library.sigma(k, Pk, R1))/(M2-M)
+
+
+def test_sigma_many_matches_quad():
+    sigma, dsigma_dR = sigma_many(k, Pk, R, derivative=True)
+    np.testing.assert_allclose(sigma, sigma_ref, rtol=1e-6)
+    np.testing.assert_allclose(dsigma_dR, dsigma_dR_ref, rtol=1e-6)
+
+
+def test_variance_k_grid_matches_quad():
+    k_nodes, weights, error = variance_k_grid(k, Pk, R.min(), R.max(), rtol=sigma_rtol)
+    assert error <= sigma_rtol
+    sigma, dsigma_dR = sigma_many(k_nodes, None, R, derivative=True, weights=weights)
+    np.testing.assert_allclose(sigma, sigma_ref, rtol=sigma_rtol)
+    np.testing.assert_allclose(dsigma_dR, dsigma_dR_ref, rtol=sigma_rtol)
+
+
+def test_sigma_table_matches_quad():
+    table = SigmaTable(k, Pk, rhom, Masses.min()/1.1, Masses.max()*1.1, rtol=sigma_rtol)
+    np.testing.assert_allclose(table.sigma(Masses), sigma_ref, rtol=sigma_rtol)
+    np.testing.assert_allclose(table.dsigma_dM(Masses), dsigma_dR_ref*R/(3*Masses), rtol=sigma_rtol)
+
+
+@requires_pylians
+def test_sigma_many_matches_odeint(library):
+    sigma_ode = np.array([library.sigma(k, Pk, Ri) for Ri in R])
+    np.testing.assert_allclose(sigma_many(k, Pk, R), sigma_ode, rtol=sigma_rtol)
+
+
+@requires_pylians
+def test_variance_k_grid_matches_odeint(library):
+    k_nodes, weights, error = variance_k_grid(k, Pk, R.min(), R.max(), rtol=sigma_rtol)
+    sigma_ode = np.array([library.sigma(k, Pk, Ri) for Ri in R])
+    np.testing.assert_allclose(sigma_many(k_nodes, None, R, weights=weights),
+                               sigma_ode, rtol=2*sigma_rtol)
+
+
+@requires_pylians
+def test_dSdM_matches_finite_difference(library):
+    dSdM_fd = np.array([dSdM_finite_difference(library, M) for M in Masses])
+    # The forward difference itself is only accurate to ~1e-4
+    np.testing.assert_allclose(library.dSdM(k, Pk, rhom, Masses), dSdM_fd, rtol=3*sigma_rtol)
+
+
+@requires_pylians
+def test_sigma_table_matches_odeint(library):
+    table = SigmaTable(k, Pk, rhom, Masses.min()/1.1, Masses.max()*1.1, rtol=sigma_rtol)
+    sigma_ode = np.array([library.sigma(k, Pk, Ri) for Ri in R])
+    dSdM_fd = np.array([dSdM_finite_difference(library, M) for M in Masses])
+    np.testing.assert_allclose(table.sigma(Masses), sigma_ode, rtol=2*sigma_rtol)
+    np.testing.assert_allclose(table.dsigma_dM(Masses), dSdM_fd, rtol=5*sigma_rtol)
+
+
+def test_ST_mass_function_matches_uncached(library):
+    HMF_cache.clear()
+    dndM = library.ST_mass_function_uncached(
+        rhom, Masses, 1, 'LCDM', 'LCDM', 0, 0, k, Pk)
+    first = library.ST_mass_function(rhom, Masses, 1, 'LCDM', 'LCDM', 0, 0, k, Pk)
+    np.testing.assert_array_equal(first, dndM)
+    # Changing a returned array must not change the cached one
+    first *= 2
+    second = library.ST_mass_function(rhom, Masses, 1, 'LCDM', 'LCDM', 0, 0, k, Pk)
+    np.testing.assert_array_equal(second, dndM)
+
+
+@requires_pylians
+def test_ST_mass_function_matches_scalar_path(library):
+    # The scalar path still integrates sigma with odeint for every mass
+    dndM = library.ST_mass_function_uncached(
+        rhom, Masses, 1, 'LCDM', 'LCDM', 0, 0, k, Pk)
+    dndM_scalar = [library.ST_mass_function_uncached(rhom, M, 1, 'LCDM', 'LCDM', 0, 0, k, Pk)
+                   for M in Masses]
+    np.testing.assert_allclose(dndM, dndM_scalar, rtol=1e-3)
+
+
+class Pk_layout:
+    # Stand-in for a computed CLASS instance with a separable P(k, z)
+    def __init__(self, layout):
+        self.layout = layout
+
+    def pk(self, k, z):
+        return reference_Pk(k)/(1+z)**2
+
+    def get_pk_array(self, k, z, k_size, z_size, nonlinear):
+        if self.layout == 'signature':
+            raise TypeError('get_pk_array() takes exactly 4 positional arguments')
+        Pk = reference_Pk(k)[None, :]/(1+z[:, None])**2
+        return (Pk if self.layout == 'z-major' else Pk.T).ravel()
+
+
+@pytest.mark.parametrize('layout', ['z-major', 'k-major', 'signature'])
+def test_Pk_array_layout(layout, caplog):
+    library = HMF(1, 'LCDM', 'LCDM', 0, 0, Masses)
+    z = [0.0, 4.0, 9.0]
+    with caplog.at_level(logging.WARNING, logger='JWST_MG.HMF'):
+        Pk = library.Pk_array(Pk_layout(layout), z)
+    np.testing.assert_allclose(Pk, reference_Pk(kvec)[None, :]/(1+np.array(z)[:, None])**2, rtol=1e-12)
+    assert (len(caplog.records) == 0) == (layout == 'z-major')
+
+
+@requires_classy
+def test_Pk_array_matches_pk():
+    from classy import Class
+    library = HMF(1, 'nDGP', 'nDGP', 3000, 0, Masses)
+    M = Class()
+    M.set(library.class_settings('nDGP', 3000, 0))
+    M.compute()
+    z = [0.0, 5.0, 10.0]
+    Pk = library.Pk_array(M, z)
+    Pk_loop = [[M.pk(ki, zi) for ki in kvec] for zi in z]
+    M.struct_cleanup()
+    np.testing.assert_allclose(Pk, Pk_loop, rtol=1e-10)
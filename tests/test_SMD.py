@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import scipy.integrate
+from scipy.interpolate import InterpolatedUnivariateSpline as spline
+
+from JWST_MG.SMD import SMD
+
+
+def hmf_integral_gtm_simpson(M, dndm, mass_density=False):
+    # The former hmf_integral_gtm: cumulative trapezoid on the mass grid and
+    # simpson over the power law extrapolated to 1e18 on the same spacing
+    dlnm = np.log(M[1]) - np.log(M[0])
+    dndlnm = M*dndm
+    m_upper = np.arange(np.log(M[-1]), np.log(10**18), dlnm)
+    mf = spline(np.log(M), np.log(dndlnm), k=1)(m_upper)
+    if mass_density:
+        mf = m_upper + mf
+        dndlnm = M*dndlnm
+    int_upper = scipy.integrate.simpson(np.exp(mf), dx=dlnm)
+    ngtm = np.concatenate((scipy.integrate.cumulative_trapezoid(dndlnm[::-1], dx=dlnm)[::-1],
+                           np.zeros(1)))
+    return ngtm + int_upper
+
+
+library = SMD(1/6, 'LCDM', 'LCDM', 'double_power', 0, 0, None, 0.1)
+
+
+@pytest.mark.parametrize('mass_density', [False, True])
+@pytest.mark.parametrize('M, M_cut', [(np.logspace(8, 15, 500), 1e13),
+                                      (np.logspace(8, 14, 100), 1e14)])
+def test_cumulative_gtm_matches_simpson(M, M_cut, mass_density):
+    dndm = 1e-12*(M/1e10)**-1.9*np.exp(-M/M_cut)
+    gtm = library.cumulative_gtm(M, dndm, mass_density=mass_density)
+    reference = hmf_integral_gtm_simpson(M, dndm, mass_density)
+    # The two tails differ where nothing but the tail is left
+    significant = reference > 1e-6*reference[0]
+    np.testing.assert_allclose(gtm[significant], reference[significant], rtol=1e-3)
+
+
+def test_cumulative_gtm_batch_matches_rows():
+    M = np.logspace(8, 15, 200)
+    dndm = 1e-12*(M/1e10)**-1.9*np.exp(-M[None, :]/np.array([1e12, 1e13, 1e14])[:, None])
+    dndm[1, 50:53] = np.nan
+    gtm = library.cumulative_gtm(M, dndm, mass_density=True)
+    for i in range(len(dndm)):
+        np.testing.assert_array_equal(
+            gtm[i], library.cumulative_gtm(M, dndm[i], mass_density=True))
+    assert np.all(np.isnan(gtm[1, 50:53]))
+    assert np.all(np.isfinite(np.delete(gtm[1], [50, 51, 52])))
@@ -0,0 +1,89 @@
+import warnings
+import numpy as np
+import pytest
+import scipy.integrate
+import scipy.interpolate
+
+from JWST_MG.constants import Omegab0, Omegam0
+from JWST_MG.SMF import SHMR, SMF
+
+
+@pytest.mark.parametrize('model_SFR', ['toy', 'double_power'])
+def test_epsilon_needs_f0(model_SFR):
+    with pytest.raises(ValueError):
+        SHMR(model_SFR).epsilon(np.logspace(9, 12, 4), 5)
+    assert SHMR(model_SFR).epsilon(np.logspace(9, 12, 4), 5, 0.1).shape == (4,)
+
+
+@pytest.mark.parametrize('model_SFR', ['phenomenological_extreme', 'phenomenological_regular',
+                                       'toy', 'Puebla', 'double_power'])
+def test_epsilon_broadcasts_over_f0(model_SFR):
+    f0 = np.array([0.05, 0.2, 0.5])
+    Mh = np.logspace(9, 12, 4)
+    z = np.array([5.0, 7.0])
+    epsilon = SHMR(model_SFR).epsilon(Mh[None, :, None], z[None, None, :], f0[:, None, None])
+    assert epsilon.shape == (len(f0), len(Mh), len(z))
+    for i in range(len(f0)):
+        np.testing.assert_array_equal(epsilon[i], SHMR(model_SFR).epsilon(Mh[:, None], z, f0[i]))
+
+
+# Toy halo mass function on the halo masses of the SMF likelihoods
+Masses = np.logspace(6, 16, 100)
+HMF_fid = 1e-12*(Masses/1e10)**-1.9*np.exp(-Masses/1e13)
+
+
+def SMF_quad(library, a, model_SFR, f0):
+    # The SMF of the former SMF_obs: scipy quad of SMF_interpolation for each M*
+    z = 1/a-1
+    Masses_star = library.epsilon(Masses, model_SFR, a, f0)*Omegab0/Omegam0*Masses
+    SMF = scipy.interpolate.interp1d(Masses_star, Masses_star*np.log(10)*HMF_fid*np.gradient(Masses) /
+                                     np.gradient(Masses_star), fill_value="extrapolate")
+    ci = 0.273*(1+np.exp(1.077-z))**(-1)
+    ci1 = 0.273*(1+np.exp(1.077-1))**(-1)
+    c = 1 if z < 1 else ci + (1-ci1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', scipy.integrate.IntegrationWarning)
+        return c*np.array([library.SMF_interpolation(Mstar, SMF, z, np.log10(min(Masses_star)),
+                                                     np.log10(max(Masses_star)))
+                           for Mstar in np.logspace(6, 13, 150)])
+
+
+@pytest.mark.parametrize('model_SFR, f0, a', [('double_power', 0.2, 1/6),
+                                              ('double_power', 0.05, 1/9),
+                                              ('Puebla', None, 1/2)])
+def test_SMF_convolution_matches_quad(model_SFR, f0, a):
+    library = SMF(a, 'LCDM', 'LCDM', model_SFR, 0, 0, Masses, f0)
+    Masses_star, SMF_conv = library.stellar_stage(Masses, HMF_fid, a, model_SFR, f0)
+    reference = SMF_quad(library, a, model_SFR, f0)
+    np.testing.assert_allclose(Masses_star, np.logspace(6, 13, 150))
+    # quad itself loses accuracy where the SMF has dropped by many decades
+    significant = reference > 1e-5*reference.max()
+    np.testing.assert_allclose(SMF_conv[significant], reference[significant], rtol=1e-3)
+
+
+def test_SMF_convolution_shifts_match_quad():
+    # An array of f0 is convolved in one batch of shifted SMFs
+    a = 1/6
+    f0 = np.array([0.05, 0.2, 0.5])
+    library = SMF(a, 'LCDM', 'LCDM', 'double_power', 0, 0, Masses)
+    SMF_conv = library.stellar_stage(Masses, HMF_fid, a, 'double_power', f0)[1]
+    assert SMF_conv.shape == (len(f0), 150)
+    for i in range(len(f0)):
+        reference = SMF_quad(library, a, 'double_power', f0[i])
+        significant = reference > 1e-5*reference.max()
+        np.testing.assert_allclose(SMF_conv[i][significant], reference[significant], rtol=1e-3)
+
+
+@pytest.mark.parametrize('model_SFR', ['phenomenological_extreme', 'phenomenological_regular',
+                                       'toy', 'double_power', 'Puebla'])
+def test_stellar_stage_f0_array_matches_scalar(model_SFR):
+    a = 1/6
+    f0 = np.array([0.05, 0.2, 0.5])
+    library = SMF(a, 'LCDM', 'LCDM', model_SFR, 0, 0, Masses)
+    Masses_star, SMF_batch = library.stellar_stage(Masses, HMF_fid, a, model_SFR, f0)
+    assert SMF_batch.shape[0] == len(f0)
+    for i in range(len(f0)):
+        Masses_star_i, SMF_i = library.stellar_stage(Masses, HMF_fid, a, model_SFR, f0[i])
+        np.testing.assert_allclose(Masses_star if model_SFR in ('double_power', 'Puebla') else Masses_star[i],
+                                   Masses_star_i, rtol=1e-12)
+        np.testing.assert_allclose(SMF_batch[i], SMF_i, rtol=1e-10)
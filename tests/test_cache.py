@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from JWST_MG.cache import Pk_cache
+
+
+k = np.logspace(-3, 1, 50)
+z = np.array([0.0, 5.0])
+Pk = np.ones((len(z), len(k)))
+
+
+def test_save_and_load(tmp_path):
+    cache = Pk_cache(str(tmp_path), max_size=1e9)
+    key = cache.key({'h': 0.7}, k, z)
+    assert cache.load(key) is None
+    cache.save(key, Pk, k, z)
+    np.testing.assert_array_equal(cache.load(key), Pk)
+
+
+@pytest.mark.parametrize('damage', ['truncate', 'garbage', 'empty'])
+def test_damaged_entry_is_removed(tmp_path, damage):
+    cache = Pk_cache(str(tmp_path), max_size=1e9)
+    key = cache.key({'h': 0.7}, k, z)
+    cache.save(key, Pk, k, z)
+    filename = tmp_path / (key + '.npz')
+    content = filename.read_bytes()
+    filename.write_bytes({'truncate': content[:len(content)//2],
+                          'garbage': b'not a zip file at all',
+                          'empty': b''}[damage])
+    assert cache.load(key) is None
+    assert not filename.exists()
+    cache.save(key, Pk, k, z)
+    np.testing.assert_array_equal(cache.load(key), Pk)
+
+
+def test_key_depends_on_class_version(tmp_path):
+    cache = Pk_cache(str(tmp_path))
+    key = cache.key({'h': 0.7}, k, z)
+    cache.class_version = cache.class_version + ' rebuilt'
+    assert cache.key({'h': 0.7}, k, z) != key
+
+
+def test_unwritable_cache_is_ignored(tmp_path):
+    # A file where the cache directory should be
+    path = tmp_path / 'cache'
+    path.write_text('')
+    cache = Pk_cache(str(path), max_size=1e9)
+    key = cache.key({'h': 0.7}, k, z)
+    cache.save(key, Pk, k, z)
+    assert cache.load(key) is None
+
+
+def test_eviction_keeps_size_limit(tmp_path):
+    cache = Pk_cache(str(tmp_path), max_size=1e9)
+    cache.save(cache.key({'h': 0.0}, k, z), Pk, k, z)
+    size = cache.size
+    cache.max_size = 2.5*size
+    keys = [cache.key({'h': 0.1*i}, k, z) for i in range(1, 6)]
+    for key in keys:
+        cache.save(key, Pk, k, z)
+    files = list(tmp_path.glob('*.npz'))
+    assert sum(f.stat().st_size for f in files) <= cache.max_size
+    assert cache.load(keys[-1]) is not None
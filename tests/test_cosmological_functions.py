@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import scipy.integrate
+
+from JWST_MG.constants import ai
+from JWST_MG.cosmological_functions import cosmological_functions, kernel
+from JWST_MG.delta_c import delta_c
+
+
+a = np.geomspace(ai, 2, 200)
+library = cosmological_functions(1, 'LCDM', 'LCDM', 0, 0)
+
+# Cosmologies whose fused kernels are checked against H_f, dH_f and mu
+cosmologies = [('LCDM', 'LCDM', 0, 0),
+               ('wCDM', 'wCDM', -1.3, 0.55),
+               ('nDGP', 'nDGP', 3000, 0),
+               ('E11', 'LCDM', 0.7, 0),
+               ('DES', 'LCDM', 0.4, -0.3),
+               ('gmu', 'LCDM', 0.6, 0)]
+
+
+@pytest.mark.parametrize('model, model_H, par1, par2', cosmologies)
+def test_kernel_matches_H_dH_mu(model, model_H, par1, par2):
+    H, dH, mu = kernel(model, model_H, par1, par2).H_dH_mu(a)
+    np.testing.assert_allclose(H, library.H_f(a, model_H, par1, par2), rtol=1e-10)
+    np.testing.assert_allclose(dH, library.dH_f(a, model_H, par1, par2), rtol=1e-10)
+    mu_ref = [library.mu(scale, model, model_H, par1, par2, type='linear') for scale in a]
+    np.testing.assert_allclose(mu*np.ones_like(a), mu_ref, rtol=1e-10)
+
+
+def test_kernel_matches_nonlinear_nDGP_mu():
+    x = np.geomspace(0.1, 10, len(a))
+    H, dH, mu = kernel('nDGP', 'nDGP', 3000, 0).H_dH_mu(a, x)
+    mu_ref = [library.mu(a[i], 'nDGP', 'nDGP', 3000, 0, type='nonlinear', x=x[i])
+              for i in range(len(a))]
+    np.testing.assert_allclose(mu, mu_ref, rtol=1e-10)
+
+
+@pytest.mark.parametrize('model, model_H, par1', [('LCDM', 'LCDM', 0), ('nDGP', 'nDGP', 3000)])
+def test_growth_matches_delta_l_ODE(model, model_H, par1):
+    # Direct solve of the linear ODE from the growing mode at ai
+    solution = scipy.integrate.solve_ivp(delta_c(1, model, model_H, par1, 0).delta_l_ODE, (ai, 1),
+                                         [ai, 1.0], args=(model, model_H, par1, 0),
+                                         rtol=1e-11, atol=1e-14, dense_output=True).sol
+    a_eval = np.geomspace(0.01, 1, 20)
+    D, dDda = solution(a_eval)
+    np.testing.assert_allclose(library.growth(a_eval, model, model_H, par1, 0),
+                               D/solution(1)[0], rtol=1e-6)
+    np.testing.assert_allclose(library.growth_rate(a_eval, model, model_H, par1, 0),
+                               a_eval*dDda/D, rtol=1e-6)
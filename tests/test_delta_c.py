@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from scipy.integrate import ode
+
+from JWST_MG.constants import ai
+from JWST_MG.delta_c import delta_c, deltac_cache, load_deltac_table
+
+# Points between the table nodes, checked against the direct solve
+table_points = [('LCDM', 'LCDM', 0, 0, 0.123),
+                ('E11', 'LCDM', 0.33, 0, 0.2),
+                ('E11', 'LCDM', 1.73, 0, 0.77),
+                ('gmu', 'LCDM', 2.45, 0, 0.31),
+                ('DES', 'LCDM', 0.63, -0.71, 0.77),
+                ('DES', 'LCDM', -0.55, 0.83, 0.037),
+                ('wCDM', 'wCDM', -2.73, 0.71, 0.31),
+                ('wCDM', 'wCDM', -1.13, 0.57, 0.99),
+                ('nDGP', 'nDGP', 3000, 0, 0.5),
+                ('nDGP', 'nDGP', 400, 0, 0.2)]
+
+
+@pytest.mark.parametrize('model, model_H, par1, par2, ac', table_points)
+def test_table_matches_direct_solve(model, model_H, par1, par2, ac):
+    assert load_deltac_table(model, model_H) is not None
+    deltac = delta_c(ac, model, model_H, par1, par2)
+    table = deltac.delta_c_table(ac, model, model_H, par1, par2)
+    direct = deltac.delta_c_at_ac(ac, model, model_H, par1, par2, use_table=False)
+    assert table == pytest.approx(direct, rel=2e-4)
+
+
+# delta_c from the original fixed-step collapse and binary search over
+# delta_ini (baseline solver). Its 2e-5 step in a and the spacing of delta_ini
+# limit it to a few 1e-4 for early collapse.
+baseline = {('LCDM', 'LCDM', 0): {0.1: 1.6876958518199858, 0.5: 1.684217369667197,
+                                  1.0: 1.675460291353332},
+            ('nDGP', 'nDGP', 3000): {0.1: 1.6927389004565674, 0.5: 1.7187499454680262,
+                                     1.0: 1.7085951246434334}}
+
+
+@pytest.mark.parametrize('model, model_H, par1', list(baseline.keys()))
+def test_delta_c_curve_matches_shooting(model, model_H, par1):
+    ac_arr = np.geomspace(0.05, 1, 8)
+    deltac = delta_c(ac_arr, model, model_H, par1, 0)
+    curve = deltac.delta_c_curve(ac_arr, model, model_H, par1, 0)
+    shooting = [deltac.delta_c_at_ac(ac, model, model_H, par1, 0, use_table=False)
+                for ac in ac_arr]
+    np.testing.assert_allclose(curve, shooting, rtol=1e-5)
+
+
+def test_delta_c_curve_near_latest_collapse():
+    # For w = -1.5, gamma = 0.8 perturbations below a threshold deltai never
+    # collapse, and the latest collapse is just after a = 1
+    ac_arr = np.geomspace(0.5, 1, 6)
+    deltac = delta_c(ac_arr, 'wCDM', 'wCDM', -1.5, 0.8)
+    curve = deltac.delta_c_curve(ac_arr, 'wCDM', 'wCDM', -1.5, 0.8)
+    shooting = [deltac.delta_c_at_ac(ac, 'wCDM', 'wCDM', -1.5, 0.8, use_table=False)
+                for ac in ac_arr]
+    np.testing.assert_allclose(curve, shooting, rtol=1e-5)
+
+
+def test_delta_c_curve_leaves_cache():
+    # Interpolated curve values must not be returned by delta_c_at_ac later
+    ac_arr = np.array([0.3, 0.7])
+    deltac = delta_c(ac_arr, 'LCDM', 'LCDM', 0.5, 0)
+    deltac.delta_c_curve(ac_arr, 'LCDM', 'LCDM', 0.5, 0)
+    for ac in ac_arr:
+        assert deltac_cache.get((ac, 'LCDM', 'LCDM', 0.5, 0)) is None
+
+
+@pytest.mark.parametrize('model, model_H, par1', list(baseline.keys()))
+def test_delta_c_matches_baseline(model, model_H, par1):
+    ac_arr = np.array(sorted(baseline[(model, model_H, par1)]))
+    reference = [baseline[(model, model_H, par1)][ac] for ac in ac_arr]
+    deltac = delta_c(ac_arr, model, model_H, par1, 0)
+    curve = deltac.delta_c_curve(ac_arr, model, model_H, par1, 0)
+    shooting = [deltac.delta_c_at_ac(ac, model, model_H, par1, 0, use_table=False)
+                for ac in ac_arr]
+    np.testing.assert_allclose(curve, reference, rtol=5e-4)
+    np.testing.assert_allclose(shooting, reference, rtol=5e-4)
+
+
+def linear_fixed_step(deltac, deltai_collapse, a, model, model_H, par1, par2):
+    # The former linear: vode with fixed steps of 1e-5 in a from the growing mode
+    dt = 0.00001
+    system = ode(deltac.delta_l_ODE).set_f_params(model, model_H, par1, par2)
+    system.set_initial_value([deltai_collapse, deltai_collapse/ai], ai)
+    data = []
+    while system.successful() and system.t <= a:
+        data.append([system.t + dt, system.integrate(system.t + dt)[0]])
+    return np.array(data)
+
+
+@pytest.mark.parametrize('model, model_H, par1', list(baseline.keys()))
+def test_linear_matches_fixed_step(model, model_H, par1):
+    deltac = delta_c(1, model, model_H, par1, 0)
+    reference = linear_fixed_step(deltac, 1e-3, 1, model, model_H, par1, 0)
+    # vode's default rtol = 1e-6 limits the reference
+    for a, delta in reference[np.searchsorted(reference[:, 0], [0.1, 0.5, 1])]:
+        assert deltac.linear(1e-3, a, model, model_H, par1, 0)[-1, 1] == pytest.approx(delta, rel=1e-5)
+        assert deltac.linear_delta(1e-3, a, model, model_H, par1, 0) == pytest.approx(delta, rel=1e-5)
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pytest
+
+from scipy.interpolate import interp1d
+from JWST_MG.constants import K0_arr, beta_arr
+from JWST_MG.kmoufl import kmoufl_background, load_kmoufl_background
+
+
+a = np.geomspace(1e-3, 1, 50)
+
+
+def write_legacy(path):
+    # Object array of interp1d for H(a) like the pickled kmoufl_H.npy
+    H_int = np.empty((len(K0_arr), len(beta_arr)), dtype=object)
+    for i, K0 in enumerate(K0_arr):
+        for j, beta in enumerate(beta_arr):
+            H_int[i, j] = interp1d(a, (1+beta*K0)*a**-1.5)
+    np.save(os.path.join(path, 'kmoufl_H.npy'), H_int, allow_pickle=True)
+
+
+def test_legacy_table_converted_once(tmp_path):
+    write_legacy(tmp_path)
+    tables = load_kmoufl_background(str(tmp_path))
+    assert os.path.exists(tmp_path / 'kmoufl_H_table.npy')
+    assert os.path.exists(tmp_path / 'kmoufl_axes.npz')
+    os.remove(tmp_path / 'kmoufl_H.npy')
+    converted = load_kmoufl_background(str(tmp_path))
+    assert isinstance(converted.H, np.memmap)
+    np.testing.assert_array_equal(converted.H, tables.H)
+
+
+def test_legacy_table_read_only(tmp_path, monkeypatch):
+    write_legacy(tmp_path)
+
+    def save(self, path):
+        raise PermissionError(13, 'Permission denied', path)
+    monkeypatch.setattr(kmoufl_background, 'save', save)
+    tables = load_kmoufl_background(str(tmp_path))
+    assert tables.H.shape == (len(K0_arr), len(beta_arr), len(a))
+
+
+def test_missing_table_names_command(tmp_path):
+    # The checkout holds a git-lfs pointer until 'git lfs pull'
+    (tmp_path / 'kmoufl_H.npy').write_text(
+        'version https://git-lfs.github.com/spec/v1\n')
+    with pytest.raises(Exception, match='python -m JWST_MG.kmoufl'):
+        load_kmoufl_background(str(tmp_path))
+
+
+# Synthetic table bilinear in (K0, beta), so the blend is exact between nodes
+K0_grid = np.array([0.0, 1.0, 2.0, 4.0])
+beta_grid = np.array([0.0, 0.1, 0.3])
+a_grid = np.geomspace(1e-3, 1, 400)
+
+
+def synthetic_H(a, beta, K0):
+    return (1+0.5*K0+2*beta+3*K0*beta)*70*a**-1.5
+
+
+synthetic = kmoufl_background(K0_grid, beta_grid, a_grid,
+                              synthetic_H(a_grid, beta_grid[None, :, None], K0_grid[:, None, None]))
+
+
+def test_blend_exact_at_nodes():
+    for K0 in K0_grid:
+        for beta in beta_grid:
+            H, dH = synthetic.H_dH(a_grid, beta, K0)
+            np.testing.assert_allclose(H, synthetic_H(a_grid, beta, K0), rtol=1e-14)
+
+
+def test_blend_linear_between_nodes():
+    for K0, beta in [(0.3, 0.05), (1.5, 0.2), (3.7, 0.01)]:
+        H, dH = synthetic.H_dH(a_grid, beta, K0)
+        np.testing.assert_allclose(H, synthetic_H(a_grid, beta, K0), rtol=1e-12)
+
+
+def test_blend_clipped_at_grid_edges():
+    for (K0, beta), (K0_edge, beta_edge) in [((-1, 0.2), (0, 0.2)), ((6, 0.2), (4, 0.2)),
+                                             ((1.5, -0.1), (1.5, 0)), ((10, 1), (4, 0.3))]:
+        np.testing.assert_array_equal(synthetic.H_dH(a_grid, beta, K0),
+                                      synthetic.H_dH(a_grid, beta_edge, K0_edge))
+
+
+def test_mixed_pairs_match_single_pairs():
+    a = np.array([[0.01, 0.1, 0.5], [0.02, 0.2, 1.0]])
+    beta = np.array([[0.0, 0.05, 0.3], [0.05, 0.0, 0.3]])
+    K0 = np.array([1.0, 2.5, 1.0])
+    H, dH = synthetic.H_dH(a, beta, K0)
+    assert H.shape == a.shape
+    for index in np.ndindex(a.shape):
+        H_pair, dH_pair = synthetic.H_dH(a[index], beta[index], K0[index[1]])
+        assert H[index] == H_pair
+        assert dH[index] == dH_pair
+
+
+def test_dH_matches_analytic_derivative():
+    a = np.geomspace(2e-3, 0.9, 57)
+    H, dH = synthetic.H_dH(a, 0.2, 1.5)
+    np.testing.assert_allclose(dH, -1.5*synthetic_H(a, 0.2, 1.5)/a, rtol=1e-6)
+
+
+def test_linear_extrapolation_beyond_a():
+    # Beyond the grid of a, H continues linearly with the slope at the edge
+    H_edge, dH_edge = synthetic.H_dH(np.array([a_grid[0], a_grid[-1]]), 0.2, 1.5)
+    a = np.array([5e-4, 1.5])
+    H, dH = synthetic.H_dH(a, 0.2, 1.5)
+    np.testing.assert_allclose(H, H_edge+dH_edge*(a-a_grid[[0, -1]]), rtol=1e-14)
+    np.testing.assert_array_equal(dH, dH_edge)
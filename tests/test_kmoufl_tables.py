@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import numpy as np
+import pytest
+
+from JWST_MG.constants import H0, Omegam0, Omegar0
+
+requires_classy = pytest.mark.skipif(importlib.util.find_spec("classy") is None,
+                                     reason="classy (MGCLASS) is not installed")
+
+
+def load_tables_module():
+    filename = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__))), 'tables', 'kmoufl_tables.py')
+    spec = importlib.util.spec_from_file_location('kmoufl_tables', filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+kmoufl_tables = load_tables_module()
+
+
+def test_background_H_in_class_order():
+    # Background of a flat LCDM listed like CLASS, from high z down to z = 0
+    z = np.geomspace(1e7, 1e-8, 4000)
+    H = H0*np.sqrt(Omegam0*(1+z)**3+Omegar0*(1+z)**4+1-Omegam0-Omegar0)
+    background = {'z': z, 'H [1/Mpc]': H/kmoufl_tables.c}
+    a = np.geomspace(1e-6, 1, 200)
+    H_a = H0*np.sqrt(Omegam0*a**-3+Omegar0*a**-4+1-Omegam0-Omegar0)
+    np.testing.assert_allclose(kmoufl_tables.background_H(background, a), H_a, rtol=1e-6)
+    # Same result for the reversed order
+    reversed_background = {name: values[::-1] for name, values in background.items()}
+    np.testing.assert_allclose(kmoufl_tables.background_H(reversed_background, a), H_a, rtol=1e-6)
+
+
+@requires_classy
+def test_one_node_end_to_end(tmp_path):
+    a = np.geomspace(1e-6, 1, 500)
+    key = kmoufl_tables.node_key(a)
+    K0, beta = 0.5, 0.2
+    kmoufl_tables.kmoufl_node(K0, beta, a, str(tmp_path), key)
+
+    filename = kmoufl_tables.node_filename(str(tmp_path), K0, beta)
+    assert kmoufl_tables.node_done(filename, key)
+    with np.load(filename) as node:
+        H = node['H']
+    assert H.shape == a.shape
+    assert np.all(np.isfinite(H)) and np.all(np.diff(H) < 0)
+    # h is fixed in the CLASS settings, so H(a = 1) = H0
+    assert H[-1] == pytest.approx(H0, rel=1e-3)